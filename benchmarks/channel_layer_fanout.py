@@ -0,0 +1,130 @@
+"""UnixSocketChannelLayer の group_send ファンアウト遅延ベンチマーク
+
+受信チャンネルの総数を固定したまま、それを 1 / 4 / 8 個のワーカープロセスに
+分散させ、group_send を呼んでから全チャンネルに届くまでの時間を計測する。
+比較のため、同一プロセス内の InMemoryChannelLayer の値も出力する。
+
+    python benchmarks/channel_layer_fanout.py [--receivers 240] [--rounds 200]
+"""
+
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channels.layers import InMemoryChannelLayer  # noqa: E402
+
+from python_apps_django.channel_layers import UnixSocketChannelLayer  # noqa: E402
+
+GROUP = "bench"
+
+
+def _worker(path, channel_count, rounds, ready, results):
+    async def run():
+        layer = UnixSocketChannelLayer(path=path, capacity=rounds + 10)
+        channels = [await layer.new_channel() for _ in range(channel_count)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        # 受信ループを先に起動してから準備完了を知らせる
+        layer._ensure_reader()
+        ready.put(True)
+        for _ in range(rounds):
+            await asyncio.gather(*(layer.receive(channel) for channel in channels))
+            results.put(time.monotonic())
+
+    asyncio.run(run())
+
+
+async def _send_rounds(layer, rounds, on_sent):
+    for i in range(rounds):
+        started = time.monotonic()
+        await layer.group_send(GROUP, {"type": "bench.message", "round": i})
+        await on_sent(started)
+
+
+def bench_unix(workers, receivers, rounds):
+    ctx = mp.get_context("spawn")
+    ready, results = ctx.Queue(), ctx.Queue()
+    with tempfile.TemporaryDirectory(prefix="channels-bench-") as path:
+        processes = [
+            ctx.Process(
+                target=_worker, args=(path, receivers // workers, rounds, ready, results)
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get()
+
+        latencies = []
+
+        async def wait_all(started):
+            # 全ワーカーの最後の受信時刻までを1回分の遅延とする
+            finished = max(
+                [await asyncio.to_thread(results.get) for _ in range(workers)]
+            )
+            latencies.append(finished - started)
+
+        layer = UnixSocketChannelLayer(path=path)
+        asyncio.run(_send_rounds(layer, rounds, wait_all))
+        for process in processes:
+            process.join()
+        layer._cleanup()
+    return latencies
+
+
+def bench_in_memory(receivers, rounds):
+    latencies = []
+
+    async def run():
+        layer = InMemoryChannelLayer(capacity=rounds + 10)
+        channels = [await layer.new_channel() for _ in range(receivers)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+
+        for i in range(rounds):
+            # ワーカー側と同じく、受信待ちを先に始めてから送る
+            waiting = asyncio.ensure_future(
+                asyncio.gather(*(layer.receive(channel) for channel in channels))
+            )
+            await asyncio.sleep(0)
+            started = time.monotonic()
+            await layer.group_send(GROUP, {"type": "bench.message", "round": i})
+            await waiting
+            latencies.append(time.monotonic() - started)
+
+    asyncio.run(run())
+    return latencies
+
+
+def _report(label, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{label:<28} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receivers", type=int, default=240)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"受信チャンネル {args.receivers} 個 / {args.rounds} 回の group_send")
+    _report("InMemory (1 process)", bench_in_memory(args.receivers, args.rounds))
+    for workers in (1, 4, 8):
+        _report(
+            f"UnixSocket ({workers} workers)",
+            bench_unix(workers, args.receivers, args.rounds),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""WebSocket のグループ配信における JSON / msgpack の CPU 時間ベンチマーク
+
+1件のイベントを受信者 --receivers 人のグループへ配信し、各受信者が
+WebSocket のフレームを作るまでの CPU 時間を、配信1,000件あたりで比較する。
+
+- per-recipient: 受信者ごとにイベントからペイロードを組み立ててエンコードする（従来の方式）
+- shared: group_event() で送信側が1回だけ msgpack にエンコードし、msgpack の受信者は
+  バイト列をそのまま使う。JSON の受信者向けのテキストはプロセスで1回だけ作って使い回す
+
+それぞれ InMemoryChannelLayer を経由する場合と、エンコードだけの場合を計測する。
+
+    python benchmarks/websocket_wire_format.py [--receivers 100] [--events 200]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channels.layers import InMemoryChannelLayer  # noqa: E402
+
+from python_apps_django.websocket import (  # noqa: E402
+    JSON,
+    MSGPACK,
+    WireFormatMixin,
+    group_event,
+)
+
+GROUP = "bench"
+
+PAYLOADS = {
+    "chat": {
+        "message": "こんにちは！今日の打ち合わせは15時からに変更になりました。資料は共有フォルダにあります。",
+        "username": "yamada_taro",
+    },
+    "notification": {
+        "type": "notification",
+        "notification_type": "like",
+        "message": "suzukiさんと他12人があなたの投稿にいいねしました",
+        "from_user": "suzuki",
+        "post_id": 123456,
+        "collapsed": True,
+    },
+}
+
+
+class BenchConsumer(WireFormatMixin):
+    """フレームを送らずに数えるだけのコンシューマー"""
+
+    def __init__(self, wire_format):
+        self.wire_format = wire_format
+        self.frames = 0
+        self.bytes_sent = 0
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.frames += 1
+        self.bytes_sent += len(bytes_data if bytes_data is not None else text_data.encode())
+
+    async def per_recipient(self, event):
+        await self.send_payload(event["payload"])
+
+    async def shared(self, event):
+        await self.send_frames(event)
+
+
+def _make_event(mode, payload, seq):
+    # 同じ内容のイベントが JSON 変換のキャッシュに当たらないよう連番を付ける
+    payload = {**payload, "seq": seq}
+    if mode == "shared":
+        return group_event("shared", payload)
+    return {"type": "per_recipient", "payload": payload}
+
+
+async def _run_encode_only(wire_format, mode, payload, receivers, events):
+    consumers = [BenchConsumer(wire_format) for _ in range(receivers)]
+    started = time.process_time()
+    for seq in range(events):
+        event = _make_event(mode, payload, seq)
+        for consumer in consumers:
+            await getattr(consumer, event["type"])(event)
+    return time.process_time() - started, consumers
+
+
+async def _run_channel_layer(wire_format, mode, payload, receivers, events):
+    layer = InMemoryChannelLayer(capacity=events + 10)
+    consumers = [BenchConsumer(wire_format) for _ in range(receivers)]
+    channels = [await layer.new_channel() for _ in consumers]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+
+    started = time.process_time()
+    for seq in range(events):
+        await layer.group_send(GROUP, _make_event(mode, payload, seq))
+        for consumer, channel in zip(consumers, channels):
+            event = await layer.receive(channel)
+            await getattr(consumer, event["type"])(event)
+    return time.process_time() - started, consumers
+
+
+def _report(label, elapsed, consumers):
+    frames = sum(consumer.frames for consumer in consumers)
+    size = sum(consumer.bytes_sent for consumer in consumers) / frames
+    per_thousand = elapsed / frames * 1000 * 1000
+    print(f"  {label:<34} {per_thousand:8.3f} ms / 1,000件   {size:6.1f} bytes/件")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receivers", type=int, default=100)
+    parser.add_argument("--events", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"受信者 {args.receivers} 人 / イベント {args.events} 件（CPU 時間）")
+    for name, payload in PAYLOADS.items():
+        for runner_label, runner in (
+            ("エンコードのみ", _run_encode_only),
+            ("InMemoryChannelLayer 経由", _run_channel_layer),
+        ):
+            print(f"{name}: {runner_label}")
+            for wire_format in (JSON, MSGPACK):
+                for mode in ("per-recipient", "shared"):
+                    elapsed, consumers = asyncio.run(
+                        runner(wire_format, mode.replace("-", "_"), payload, args.receivers, args.events)
+                    )
+                    _report(f"{wire_format} ({mode})", elapsed, consumers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""外部ブローカー不要のマルチプロセス対応チャンネルレイヤー
+
+InMemoryChannelLayer は同じプロセス内のソケットにしか届かないため、
+daphne を複数プロセスで動かせなかった。このレイヤーは同じホスト上の
+ワーカープロセス間で次のようにメッセージをやり取りする。
+
+- 各プロセスは ``<path>/<client_prefix>.sock`` に Unix ドメインのデータグラム
+  ソケットを開き、自分宛てのメッセージをそこで受け取る。
+  チャンネル名は ``specific.<client_prefix>!<乱数>`` で、宛先プロセスが名前から分かる。
+- グループのメンバーは ``<path>/groups.sqlite3``（WAL モード）に有効期限付きで保存する。
+  SQLite の読み書きはイベントループを止めないよう、レイヤーごとの専用スレッドで行う。
+- group_send は宛先をプロセスごとにまとめ、1プロセスにつき1データグラムで送る。
+  同じプロセス内の宛先にはソケットを経由せず直接キューへ入れる。
+
+メッセージは msgpack でシリアライズし、expiry 秒を過ぎたものは受信時に捨てる。
+チャンネルごとのキューは capacity / channel_capacity を上限とし、
+溢れた場合 send は ChannelFull を送出し、group_send は黙って捨てる（他のレイヤーと同じ挙動）。
+別プロセス宛てで受信側のバッファが一杯の場合や、MAX_DATAGRAM_SIZE を超える場合も同様で、
+send は ChannelFull を送出し、group_send はログに残して捨てる。
+終了したプロセス宛ての送信に失敗した場合は、そのプロセスのグループ登録を削除する。
+
+設定例::
+
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "python_apps_django.channel_layers.UnixSocketChannelLayer",
+            "CONFIG": {"path": "/tmp/django-channels"},
+        }
+    }
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# 1データグラムの最大サイズ（これを超えるメッセージは送れない）
+MAX_DATAGRAM_SIZE = 256 * 1024
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """Unix ドメインソケットと SQLite によるホスト内マルチプロセス用チャンネルレイヤー"""
+
+    extensions = ["groups", "flush"]
+
+    def __init__(
+        self,
+        path=None,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.path = str(path or os.path.join(tempfile.gettempdir(), "django-channels"))
+        self.group_expiry = group_expiry
+        self.client_prefix = uuid.uuid4().hex[:12]
+
+        self._lock = threading.Lock()
+        self._db_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="channel-layer-groups"
+        )
+        self._socket = None
+        self._db = None
+        self._loop = None
+        self._queues = {}
+
+    # 内部処理
+
+    def _socket_path(self, client_prefix):
+        return os.path.join(self.path, f"{client_prefix}.sock")
+
+    def _ensure_setup(self):
+        if self._socket is not None:
+            return
+        with self._lock:
+            if self._socket is not None:
+                return
+            os.makedirs(self.path, exist_ok=True)
+
+            db = sqlite3.connect(
+                os.path.join(self.path, "groups.sqlite3"),
+                timeout=5,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS groups ("
+                " group_name TEXT NOT NULL,"
+                " channel TEXT NOT NULL,"
+                " expires REAL NOT NULL,"
+                " PRIMARY KEY (group_name, channel))"
+            )
+            self._db = db
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+            sock.bind(self._socket_path(self.client_prefix))
+            sock.setblocking(False)
+            self._socket = sock
+            atexit.register(self._cleanup)
+
+    def _cleanup(self):
+        """プロセス終了時にソケットと自分のグループ登録を片付ける"""
+        try:
+            self._forget_client(self.client_prefix)
+        except sqlite3.Error:
+            pass
+        try:
+            os.unlink(self._socket_path(self.client_prefix))
+        except OSError:
+            pass
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    async def _execute_async(self, sql, params=()):
+        """_execute を専用スレッドで行う（ロック待ちやチェックポイントでループを止めない）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db_executor, self._execute, sql, params)
+
+    def _forget_client(self, client_prefix):
+        self._execute(
+            "DELETE FROM groups WHERE channel LIKE ?", (f"%.{client_prefix}!%",)
+        )
+
+    def _client_of(self, channel):
+        if "!" not in channel:
+            return None
+        return channel.split("!", 1)[0].rsplit(".", 1)[-1]
+
+    def _queue(self, channel):
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue(
+                maxsize=self.get_capacity(channel)
+            )
+        return queue
+
+    def _on_owner_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _ensure_reader(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+            loop.add_reader(self._socket.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._socket.recv(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                channels, message, expires = msgpack.unpackb(data, raw=False)
+            except Exception:
+                logger.exception("チャンネルレイヤーのメッセージを復元できません")
+                continue
+            self._deliver_local(channels, message, expires, raise_full=False)
+
+    def _deliver_local(self, channels, message, expires, raise_full):
+        if time.time() > expires:
+            return
+        for channel in channels:
+            queue = self._queues.get(channel)
+            if queue is None:
+                if "!" in channel:
+                    # 受信側がすでに切断している
+                    continue
+                queue = self._queue(channel)
+            try:
+                queue.put_nowait((expires, dict(message)))
+            except asyncio.QueueFull:
+                if raise_full:
+                    raise ChannelFull(channel)
+
+    def _send_datagram(self, client_prefix, channels, message, expires, raise_full):
+        data = msgpack.packb([channels, message, expires], use_bin_type=True)
+        error = None
+        if len(data) > MAX_DATAGRAM_SIZE:
+            error = f"メッセージが大きすぎます（{len(data)} bytes）"
+        else:
+            try:
+                self._socket.sendto(data, self._socket_path(client_prefix))
+            except (FileNotFoundError, ConnectionRefusedError):
+                # 宛先プロセスが終了している
+                self._db_executor.submit(self._forget_client, client_prefix)
+            except BlockingIOError:
+                error = "受信側のバッファが一杯です"
+            except OSError as exc:
+                error = str(exc)
+        if error is None:
+            return
+        if raise_full:
+            raise ChannelFull(f"{channels[0]}: {error}")
+        logger.warning("チャンネルレイヤーの送信を破棄しました（%s）: %s", client_prefix, error)
+
+    def _dispatch(self, channels, message, raise_full):
+        expires = time.time() + self.expiry
+        by_client = defaultdict(list)
+        for channel in channels:
+            by_client[self._client_of(channel) or self.client_prefix].append(channel)
+
+        for client_prefix, targets in by_client.items():
+            if client_prefix == self.client_prefix and self._on_owner_loop():
+                self._deliver_local(targets, message, expires, raise_full)
+            else:
+                self._send_datagram(client_prefix, targets, message, expires, raise_full)
+
+    # チャンネルレイヤー API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        self._ensure_setup()
+        self._dispatch([channel], message, raise_full=True)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self._ensure_setup()
+        self._ensure_reader()
+
+        queue = self._queue(channel)
+        try:
+            while True:
+                expires, message = await queue.get()
+                if time.time() <= expires:
+                    return message
+        except asyncio.CancelledError:
+            # コンシューマーの終了で受信が打ち切られたらキューを片付ける
+            if queue.empty():
+                self._queues.pop(channel, None)
+            raise
+
+    async def new_channel(self, prefix="specific"):
+        self._ensure_setup()
+        channel = f"{prefix}.{self.client_prefix}!{uuid.uuid4().hex}"
+        self._queue(channel)
+        return channel
+
+    async def flush(self):
+        self._ensure_setup()
+        await self._execute_async("DELETE FROM groups")
+        self._queues = {}
+
+    async def close(self):
+        pass
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._ensure_setup()
+        await self._execute_async(
+            "INSERT OR REPLACE INTO groups (group_name, channel, expires) VALUES (?, ?, ?)",
+            (group, channel, time.time() + self.group_expiry),
+        )
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._ensure_setup()
+        await self._execute_async(
+            "DELETE FROM groups WHERE group_name = ? AND channel = ?", (group, channel)
+        )
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        self._ensure_setup()
+
+        now = time.time()
+        rows = await self._execute_async(
+            "SELECT channel, expires FROM groups WHERE group_name = ?", (group,)
+        )
+        channels = [channel for channel, expires in rows if expires > now]
+        if len(channels) != len(rows):
+            await self._execute_async(
+                "DELETE FROM groups WHERE group_name = ? AND expires <= ?", (group, now)
+            )
+        if channels:
+            self._dispatch(channels, message, raise_full=False)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -95,7 +96,24 @@ WSGI_APPLICATION = "python_apps_django.wsgi.application"
 ASGI_APPLICATION = "python_apps_django.asgi.application"
 
 # Channels settings
-CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+# 同一ホスト上の複数 daphne プロセス間で届くよう Unix ソケットのレイヤーを使う
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "python_apps_django.channel_layers.UnixSocketChannelLayer",
+        "CONFIG": {"path": os.environ.get("CHANNEL_LAYER_DIR") or None},
+    }
+}
+
+# Cache
+# ホームのキャッシュの無効化が全プロセスに効くよう、同一ホストで共有できるファイルキャッシュを使う
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("CACHE_DIR")
+        or os.path.join(tempfile.gettempdir(), "django-cache"),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
 
 
 # Database
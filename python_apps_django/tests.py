@@ -0,0 +1,117 @@
+import asyncio
+import shutil
+import tempfile
+
+from channels.exceptions import ChannelFull
+from django.test import SimpleTestCase
+
+from .channel_layers import MAX_DATAGRAM_SIZE, UnixSocketChannelLayer
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    """UnixSocketChannelLayer の容量・有効期限・プロセス間配送・終了したプロセスの片付け
+
+    同じディレクトリを使うレイヤーのインスタンスを2つ作り、別プロセスとして扱う
+    （client_prefix が異なるので、互いの宛先にはソケット経由で届く）。
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="channels-test-")
+        self.layers = []
+
+    def tearDown(self):
+        for layer in self.layers:
+            layer._cleanup()
+            layer._db_executor.shutdown()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def make_layer(self, **kwargs):
+        layer = UnixSocketChannelLayer(path=self.path, **kwargs)
+        self.layers.append(layer)
+        return layer
+
+    async def receive(self, layer, channel, timeout=1):
+        return await asyncio.wait_for(layer.receive(channel), timeout)
+
+    async def group_members(self, layer, group):
+        rows = await layer._execute_async(
+            "SELECT channel FROM groups WHERE group_name = ?", (group,)
+        )
+        return {channel for channel, in rows}
+
+    async def test_send_and_receive_in_process(self):
+        layer = self.make_layer()
+        channel = await layer.new_channel()
+        await layer.send(channel, {"type": "test.message", "text": "こんにちは"})
+        message = await self.receive(layer, channel)
+        self.assertEqual(message["text"], "こんにちは")
+
+    async def test_capacity(self):
+        layer = self.make_layer(capacity=2)
+        channel = await layer.new_channel()
+        await layer.group_add("room", channel)
+        # コンシューマーが受信中のプロセスと同じ状態にする
+        layer._ensure_reader()
+        await layer.send(channel, {"type": "test.message", "n": 1})
+        await layer.send(channel, {"type": "test.message", "n": 2})
+        with self.assertRaises(ChannelFull):
+            await layer.send(channel, {"type": "test.message", "n": 3})
+        # group_send は溢れた分を黙って捨てる
+        await layer.group_send("room", {"type": "test.message", "n": 4})
+        self.assertEqual((await self.receive(layer, channel))["n"], 1)
+        self.assertEqual((await self.receive(layer, channel))["n"], 2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, channel, timeout=0.1)
+
+    async def test_expiry(self):
+        layer = self.make_layer(expiry=0.05)
+        channel = await layer.new_channel()
+        await layer.send(channel, {"type": "test.message"})
+        await asyncio.sleep(0.1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, channel, timeout=0.1)
+
+    async def test_cross_process_group_send(self):
+        sender, receiver = self.make_layer(), self.make_layer()
+        local = await sender.new_channel()
+        remote = [await receiver.new_channel() for _ in range(3)]
+        for channel in [local, *remote]:
+            await sender.group_add("room", channel)
+        # 受信側のソケットの読み込みを先に始める
+        receiver._ensure_reader()
+
+        await sender.group_send("room", {"type": "test.message", "data": b"\x00\x01"})
+        self.assertEqual((await self.receive(sender, local))["data"], b"\x00\x01")
+        for channel in remote:
+            self.assertEqual((await self.receive(receiver, channel))["data"], b"\x00\x01")
+
+    async def test_cross_process_send_too_large(self):
+        sender, receiver = self.make_layer(), self.make_layer()
+        remote = await receiver.new_channel()
+        await sender.group_add("room", remote)
+        message = {"type": "test.message", "data": b"x" * MAX_DATAGRAM_SIZE}
+        with self.assertRaises(ChannelFull):
+            await sender.send(remote, message)
+        # group_send はログに残して捨てる
+        with self.assertLogs("python_apps_django.channel_layers", "WARNING"):
+            await sender.group_send("room", message)
+
+    async def test_dead_client_is_forgotten(self):
+        sender, receiver = self.make_layer(), self.make_layer()
+        remote = await receiver.new_channel()
+        await sender.group_add("room", remote)
+        # 受信側のプロセスが終了した
+        receiver._cleanup()
+
+        await sender.group_send("room", {"type": "test.message"})
+        # 登録の削除は専用スレッドで行われるので、後続の操作の完了を待つ
+        self.assertEqual(await self.group_members(sender, "room"), set())
+
+    async def test_group_discard(self):
+        layer = self.make_layer()
+        channel = await layer.new_channel()
+        await layer.group_add("room", channel)
+        await layer.group_discard("room", channel)
+        await layer.group_send("room", {"type": "test.message"})
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, channel, timeout=0.1)
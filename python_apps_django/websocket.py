@@ -0,0 +1,114 @@
+"""WebSocket コンシューマーの送受信フォーマット（JSON / msgpack）
+
+接続時に Sec-WebSocket-Protocol で ``msgpack`` を要求したクライアントには
+msgpack のバイナリフレームで、それ以外（既存のブラウザ画面など）にはこれまでどおり
+JSON のテキストフレームで送る。``json`` を明示して要求した場合もテキストフレームになる。
+
+グループ宛てのイベントは group_event() で送信側が1回だけ msgpack にエンコードし、
+イベントに入れて配る。msgpack のクライアントにはそのバイト列をそのまま送る。
+JSON のクライアント向けのテキストは、受信したプロセスで最初に必要になった時に1回だけ作り、
+同じイベントの他の受信者には使い回す。受信者ごとの json.dumps は発生せず、
+イベントの大きさも msgpack 1つ分で済む（コストの比較は benchmarks/websocket_wire_format.py）。
+チャンネルレイヤーのメッセージには大きさの上限があるため
+（UnixSocketChannelLayer は MAX_DATAGRAM_SIZE）、大きなペイロードは送らないこと。
+
+クライアントから届いた壊れたフレームは decode() が None を返すので、コンシューマーは無視する。
+
+使い方::
+
+    class ChatConsumer(WireFormatMixin, AsyncWebsocketConsumer):
+        async def receive(self, text_data=None, bytes_data=None):
+            data = self.decode(text_data, bytes_data)
+            if data is None:
+                return
+            ...
+
+        async def chat_message(self, event):
+            await self.send_frames(event)
+
+    await channel_layer.group_send(group, group_event("chat_message", {...}))
+"""
+
+import json
+import logging
+from functools import lru_cache
+
+import msgpack
+
+logger = logging.getLogger(__name__)
+
+MSGPACK = "msgpack"
+JSON = "json"
+
+# JSON に変換済みのイベントを覚えておく件数（プロセスごと）
+JSON_FRAME_CACHE_SIZE = 1024
+
+
+def encode_json(payload):
+    return json.dumps(payload)
+
+
+def encode_msgpack(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def group_event(handler, payload):
+    """コンシューマーの handler で payload をそのまま送るイベントを作る"""
+    return {"type": handler, "payload": encode_msgpack(payload)}
+
+
+def event_payload(event):
+    """group_event() で作ったイベントのペイロードを取り出す"""
+    return msgpack.unpackb(event["payload"], raw=False)
+
+
+@lru_cache(maxsize=JSON_FRAME_CACHE_SIZE)
+def _json_frame(packed):
+    return encode_json(msgpack.unpackb(packed, raw=False))
+
+
+class WireFormatMixin:
+    """AsyncWebsocketConsumer 用: サブプロトコルの選択とフレームの送受信"""
+
+    wire_format = JSON
+
+    async def accept(self, subprotocol=None, headers=None):
+        if subprotocol is None:
+            requested = self.scope.get("subprotocols") or ()
+            if MSGPACK in requested:
+                subprotocol = MSGPACK
+            elif JSON in requested:
+                subprotocol = JSON
+        self.wire_format = MSGPACK if subprotocol == MSGPACK else JSON
+        await super().accept(subprotocol, headers)
+
+    def decode(self, text_data=None, bytes_data=None):
+        """受信したフレームを復元する（msgpack のクライアントもテキストで送ってよい）
+
+        壊れたフレームやオブジェクト以外の値は None を返す。
+        """
+        try:
+            if bytes_data is not None:
+                data = msgpack.unpackb(bytes_data, raw=False)
+            else:
+                data = json.loads(text_data)
+        except (TypeError, ValueError, msgpack.ExtraData, msgpack.UnpackException):
+            logger.warning("壊れた WebSocket フレームを無視しました")
+            return None
+        if not isinstance(data, dict):
+            return None
+        return data
+
+    async def send_payload(self, payload):
+        """この接続だけに送る"""
+        if self.wire_format == MSGPACK:
+            await self.send(bytes_data=encode_msgpack(payload))
+        else:
+            await self.send(text_data=encode_json(payload))
+
+    async def send_frames(self, event):
+        """group_event() でエンコード済みのイベントをそのまま送る"""
+        if self.wire_format == MSGPACK:
+            await self.send(bytes_data=event["payload"])
+        else:
+            await self.send(text_data=_json_frame(event["payload"]))
@@ -1,3 +1,21 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Room, Message
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ['title', 'name', 'last_message_at', 'created_at']
+    search_fields = ['name', 'title']
+    prepopulated_fields = {'name': ['title']}
+    readonly_fields = ['created_at', 'last_message_at']
+
+
+@admin.register(Message)
+class MessageAdmin(admin.ModelAdmin):
+    list_display = ['room', 'username', 'content', 'timestamp']
+    list_filter = ['room']
+    list_select_related = ['room']
+    search_fields = ['username', 'content']
+    readonly_fields = ['timestamp']
+    raw_id_fields = ['user']
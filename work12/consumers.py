@@ -1,66 +1,98 @@
-import json
-from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Message
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.utils import timezone
+from python_apps_django.websocket import WireFormatMixin, group_event
+from .models import Message, Room
+from .persistence import message_buffer
+from .presence import presence
+
+# URL にルーム名がない接続（/ws/chat/）の参加先
+DEFAULT_ROOM_NAME = "chat"
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(WireFormatMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # 認証確認
         if not self.scope["user"].is_authenticated:
             await self.close()
             return
 
-        self.room_name = "chat"
+        # ルームごとのグループに参加（存在しないルームは切断）
+        self.room_name = self.scope["url_route"]["kwargs"].get("room_name", DEFAULT_ROOM_NAME)
+        self.room_id = await self.get_room_id(self.room_name)
+        if self.room_id is None:
+            await self.close()
+            return
         self.room_group_name = f"chat_{self.room_name}"
 
         # チャットグループに参加
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
 
+        # オンライン状況は次の tick でまとめて送る
+        presence.join(self.room_group_name, self.scope["user"].username, self.channel_name)
+
     async def disconnect(self, close_code):
         # チャットグループから離脱
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if getattr(self, "room_group_name", None):
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            presence.leave(self.room_group_name, self.scope["user"].username)
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json["message"]
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.decode(text_data, bytes_data)
+        if text_data_json is None:
+            return
 
         # 認証されたユーザーの名前を使用
         user = self.scope["user"]
         username = user.username if user.is_authenticated else "匿名"
 
-        # メッセージをデータベースに保存
-        await self.save_message(user, username, message)
+        # 入力中の通知はすぐには送らず、間引いて次の tick でまとめる
+        if text_data_json.get("type") == "typing":
+            presence.typing(self.room_group_name, username)
+            return
 
-        # グループの全員にメッセージを送信
+        message = text_data_json.get("message")
+        if not isinstance(message, str) or not message:
+            return
+
+        # グループの全員にメッセージを先に送信（エンコードはここで1回だけ）
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message,
-                "username": username,
-            },
-        )
-
-    async def chat_message(self, event):
-        message = event["message"]
-        username = event["username"]
-
-        # WebSocketにメッセージを送信
-        await self.send(
-            text_data=json.dumps(
+            group_event(
+                "chat_message",
                 {
                     "message": message,
                     "username": username,
-                }
+                },
+            ),
+        )
+
+        # 保存は書き込み遅延バッファでまとめて行う（受信時刻で記録）
+        message_buffer.add(
+            Message(
+                room_id=self.room_id,
+                user=user if user.is_authenticated else None,
+                username=username,
+                content=message,
+                timestamp=timezone.now(),
             )
         )
 
+    async def chat_message(self, event):
+        # WebSocketにメッセージを送信（エンコード済みのフレームをそのまま使う）
+        await self.send_frames(event)
+
+    async def presence_diff(self, event):
+        await presence.answer_snapshot(self.room_group_name, event)
+
+        # 参加・退出・入力中の変化をフロントエンドに送信
+        await self.send_frames(event)
+
+    async def presence_roster(self, event):
+        # オンライン中の全員（送信元プロセスの分）をフロントエンドに送信
+        await self.send_frames(event)
+
     @database_sync_to_async
-    def save_message(self, user, username, message):
-        Message.objects.create(
-            user=user if user.is_authenticated else None,
-            username=username,
-            content=message,
-        )
+    def get_room_id(self, room_name):
+        return Room.objects.filter(name=room_name).values_list("id", flat=True).first()
@@ -0,0 +1,32 @@
+from django import forms
+from .models import Room
+
+# 他の画面の URL と重なるためルームIDに使えない名前
+RESERVED_ROOM_NAMES = {'metrics'}
+
+
+class RoomCreateForm(forms.ModelForm):
+    """ルーム作成フォーム"""
+    class Meta:
+        model = Room
+        fields = ['name', 'title']
+        widgets = {
+            'name': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'general',
+            }),
+            'title': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': '雑談',
+            }),
+        }
+        labels = {
+            'name': 'ルームID（URL に使用）',
+            'title': 'ルーム名',
+        }
+
+    def clean_name(self):
+        name = self.cleaned_data['name']
+        if name in RESERVED_ROOM_NAMES:
+            raise forms.ValidationError('このルームIDは使用できません。')
+        return name
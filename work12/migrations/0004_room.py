@@ -0,0 +1,58 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+# これまでの単一チャット（グループ名 chat_chat）の移行先
+DEFAULT_ROOM_NAME = 'chat'
+
+
+def move_messages_to_default_room(apps, schema_editor):
+    Room = apps.get_model('work12', 'Room')
+    Message = apps.get_model('work12', 'Message')
+    room, _ = Room.objects.get_or_create(name=DEFAULT_ROOM_NAME, defaults={'title': 'チャット'})
+    Message.objects.filter(room__isnull=True).update(room=room)
+    room.last_message_at = Message.objects.filter(room=room).aggregate(latest=Max('timestamp'))['latest']
+    room.save(update_fields=['last_message_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work12', '0003_message_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(unique=True)),
+                ('title', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message_at', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+            options={
+                'ordering': [models.OrderBy(models.F('last_message_at'), descending=True, nulls_last=True), '-created_at'],
+                'indexes': [models.Index(fields=['-last_message_at'], name='work12_room_last_message')],
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='room',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='work12.room'),
+        ),
+        migrations.RunPython(move_messages_to_default_room, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='work12.room'),
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='work12_message_recent',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', '-timestamp', '-id'], name='work12_message_room_recent'),
+        ),
+    ]
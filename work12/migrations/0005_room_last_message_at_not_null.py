@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def backfill_last_message_at(apps, schema_editor):
+    # 発言のないルームは作成時刻をもとに並べる
+    Room = apps.get_model('work12', 'Room')
+    Room.objects.filter(last_message_at__isnull=True).update(last_message_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work12', '0004_room'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_message_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='room',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterModelOptions(
+            name='room',
+            options={'ordering': ['-last_message_at', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='room',
+            name='work12_room_last_message',
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['-last_message_at', '-id'], name='work12_room_last_message'),
+        ),
+    ]
@@ -1,15 +1,39 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class Room(models.Model):
+    name = models.SlugField(max_length=50, unique=True)
+    title = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # ルーム一覧の並び替え用（作成時刻から始まり、メッセージの保存時にまとめて更新）
+    last_message_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        ordering = ['-last_message_at', '-id']
+        indexes = [
+            models.Index(fields=['-last_message_at', '-id'], name='work12_room_last_message'),
+        ]
+
+    def __str__(self):
+        return self.title
 
 
 class Message(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='messages')
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     username = models.CharField(max_length=100, default='匿名')
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # 書き込み遅延で後からまとめて保存するため、受信時刻を入れておく
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # ルームごとの新しい順の履歴読み込み用 (room, timestamp, id)
+            models.Index(fields=['room', '-timestamp', '-id'], name='work12_message_room_recent'),
+        ]
         
     def __str__(self):
         return f'{self.username}: {self.content[:50]}'
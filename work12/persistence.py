@@ -0,0 +1,179 @@
+"""チャットメッセージの書き込み遅延（write-behind）バッファ
+
+ChatConsumer はメッセージをすぐにグループへ配信し、保存はこのバッファに任せる。
+バッファは FLUSH_SIZE 件たまるか、最初の1件から FLUSH_INTERVAL ミリ秒たった時点で
+bulk_create でまとめて INSERT する。1件ごとのスレッド切り替えと INSERT がなくなり、
+配信が DB の遅延を待たなくなる。
+
+- タイムスタンプは受信時刻を入れておく（保存時刻ではない）
+- 保存と同時に、ルームごとの last_message_at を1回の UPDATE で進める
+- 保存に失敗したメッセージは次回に再試行する（MAX_PENDING を超えたら古いものから捨てる）
+- プロセス終了時（atexit）に、残りと保存が終わらなかった分を同期的に保存する。
+  daphne は SIGTERM / SIGINT でイベントループを止めて通常どおり終了するので、
+  実行されずに残った保存のタスクの分もここで保存される
+- metrics() でバッファの深さと保存にかかった時間を返す
+
+設定:
+    WORK12_MESSAGE_FLUSH_SIZE       まとめて保存する件数（既定 100）
+    WORK12_MESSAGE_FLUSH_INTERVAL   最長の待ち時間（ミリ秒、既定 200）
+"""
+
+import asyncio
+import atexit
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# 保存に失敗し続けた場合にメモリに抱える上限
+MAX_PENDING = 10000
+
+
+def _bulk_insert(messages):
+    from .models import Message, Room
+
+    # ルーム一覧用の最終発言時刻は、ルームごとに1回の UPDATE で進める
+    latest = {}
+    for message in messages:
+        if message.room_id not in latest or message.timestamp > latest[message.room_id]:
+            latest[message.room_id] = message.timestamp
+
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        for room_id, timestamp in latest.items():
+            Room.objects.filter(pk=room_id, last_message_at__lt=timestamp).update(
+                last_message_at=timestamp
+            )
+
+
+class MessageWriteBuffer:
+    """メッセージをためて bulk_create でまとめて保存する"""
+
+    def __init__(self, flush_size=None, flush_interval=None):
+        self.flush_size = flush_size or getattr(settings, "WORK12_MESSAGE_FLUSH_SIZE", 100)
+        self.flush_interval = (
+            flush_interval or getattr(settings, "WORK12_MESSAGE_FLUSH_INTERVAL", 200)
+        ) / 1000
+        self._pending = []
+        self._timer = None
+        # 実行中の保存のタスク（参照を持たないとタスクが GC で消えることがある）
+        self._flush_tasks = set()
+        # 保存を始めてまだ終わっていないバッチ（id(batch) -> batch）
+        self._in_flight = {}
+
+        # 計測値
+        self.saved_total = 0
+        self.dropped_total = 0
+        self.flush_count = 0
+        self.failed_flush_count = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+        atexit.register(self.flush_sync)
+
+    def add(self, message):
+        """保存するメッセージを追加し、必要なら保存を予約する"""
+        self._pending.append(message)
+        if len(self._pending) >= self.flush_size:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.flush_interval)
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _insert(self, batch):
+        _bulk_insert(batch)
+        # 呼び出し元のタスクが再開されずに終わっても保存済みとわかるよう、ここで外す
+        self._in_flight.pop(id(batch), None)
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _requeue(self, batch):
+        self._pending[:0] = batch
+        overflow = len(self._pending) - MAX_PENDING
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped_total += overflow
+            logger.error("保存できないチャットメッセージを%d件破棄しました", overflow)
+
+    def _record(self, count, started):
+        elapsed = (time.monotonic() - started) * 1000
+        self.saved_total += count
+        self.flush_count += 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self._flush_ms_total += elapsed
+        logger.debug("チャットメッセージを%d件保存しました（%.1f ms）", count, elapsed)
+
+    async def flush(self):
+        """たまっているメッセージをまとめて保存する"""
+        batch = self._take()
+        if not batch:
+            return
+        started = time.monotonic()
+        self._in_flight[id(batch)] = batch
+        try:
+            await database_sync_to_async(self._insert)(batch)
+        except Exception:
+            self._in_flight.pop(id(batch), None)
+            logger.exception("チャットメッセージの保存に失敗しました（%d件）", len(batch))
+            self.failed_flush_count += 1
+            self._requeue(batch)
+            if self._timer is None:
+                self._schedule(self.flush_interval)
+            return
+        self._record(len(batch), started)
+
+    def flush_sync(self):
+        """残りを同期的に保存する（プロセス終了時用）
+
+        イベントループが止まって結果を受け取れなかった保存中のバッチも含める。
+        """
+        in_flight = [message for batch in self._in_flight.values() for message in batch]
+        self._in_flight.clear()
+        batch = in_flight + self._take()
+        if not batch:
+            return
+        started = time.monotonic()
+        try:
+            _bulk_insert(batch)
+        except Exception:
+            logger.exception("終了時のチャットメッセージの保存に失敗しました（%d件）", len(batch))
+            self.dropped_total += len(batch)
+            return
+        self._record(len(batch), started)
+
+    def metrics(self):
+        return {
+            "depth": len(self._pending),
+            "saved_total": self.saved_total,
+            "dropped_total": self.dropped_total,
+            "flush_count": self.flush_count,
+            "failed_flush_count": self.failed_flush_count,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self._flush_ms_total / self.flush_count, 2)
+            if self.flush_count
+            else 0.0,
+        }
+
+
+message_buffer = MessageWriteBuffer()
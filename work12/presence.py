@@ -0,0 +1,200 @@
+"""チャットルームのオンライン表示と入力中表示
+
+参加・退出・キー入力のたびにグループ全員へ送ると、ルームの人数が増えるほど
+送信数が人数の2乗で増える。このモジュールはプロセスごとに次のようにまとめて送る。
+
+- ルームごとのオンライン中のユーザー（このプロセスの接続分）をメモリに持つ
+- 参加・退出・入力中の変化はためておき、TICK 秒ごとにルームにつき1件の
+  presence_diff としてグループへ送る（同じ tick 内の参加と退出は打ち消し合う）
+- 入力中の通知はユーザーごとに TYPING_THROTTLE 秒に1回だけ受け付ける
+- HEARTBEAT 秒ごとに、ルームにつき1件の presence_roster（オンライン中の全員）を送る。
+  ブラウザごとの死活確認は行わず、プロセス単位でまとめた1件で済ませる
+
+daphne を複数プロセスで動かすため、イベントには送信元プロセスの source を付け、
+ブラウザは source ごとの一覧の和を表示する。ハートビートが ttl 秒届かない source
+（終了したプロセス）の一覧はブラウザ側で捨てる。
+新しく参加した接続には、各プロセスが presence_diff を受けた時点で自分の一覧を
+presence_roster として直接送る（snapshot_to）。
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from python_apps_django.websocket import group_event
+
+logger = logging.getLogger(__name__)
+
+# 変化をまとめて送る間隔（秒）
+TICK = 1.0
+
+# 入力中の通知を受け付ける間隔（ユーザーごと、秒）
+TYPING_THROTTLE = 3.0
+
+# オンライン一覧をまとめて送り直す間隔（秒）
+HEARTBEAT = 30.0
+
+# 一覧を受け取ったブラウザが、次のハートビートまで信用する時間（秒）
+ROSTER_TTL = HEARTBEAT * 2.5
+
+# 一覧の直接送信を済ませた presence_diff を覚えておく件数
+ANSWERED_EVENTS = 1000
+
+
+class PresenceTracker:
+    """プロセス内のルームごとのオンライン状況を持ち、変化をまとめて送る"""
+
+    def __init__(self, tick=TICK, typing_throttle=TYPING_THROTTLE, heartbeat=HEARTBEAT):
+        self.tick = tick
+        self.typing_throttle = typing_throttle
+        self.heartbeat = heartbeat
+        self.source = uuid.uuid4().hex[:12]
+
+        self._online = defaultdict(Counter)
+        self._joined = defaultdict(set)
+        self._left = defaultdict(set)
+        self._typing = defaultdict(set)
+        self._snapshot_to = defaultdict(list)
+        self._last_typing = {}
+        self._answered = deque(maxlen=ANSWERED_EVENTS)
+        self._answered_set = set()
+        self._task = None
+        self._last_heartbeat = 0.0
+
+    def online(self, group):
+        return sorted(self._online.get(group, ()))
+
+    def join(self, group, username, channel_name):
+        counts = self._online[group]
+        counts[username] += 1
+        if counts[username] == 1:
+            if username in self._left[group]:
+                self._left[group].discard(username)
+            else:
+                self._joined[group].add(username)
+        self._snapshot_to[group].append(channel_name)
+        self._ensure_running()
+
+    def leave(self, group, username):
+        counts = self._online.get(group)
+        if not counts or not counts[username]:
+            return
+        counts[username] -= 1
+        if counts[username] == 0:
+            del counts[username]
+            if username in self._joined[group]:
+                self._joined[group].discard(username)
+            else:
+                self._left[group].add(username)
+            self._typing[group].discard(username)
+            self._last_typing.pop((group, username), None)
+        if not counts:
+            del self._online[group]
+
+    def typing(self, group, username):
+        """入力中の通知を受け付ける（間隔が短すぎるものは捨てる）"""
+        now = time.monotonic()
+        key = (group, username)
+        if now - self._last_typing.get(key, float("-inf")) < self.typing_throttle:
+            return False
+        self._last_typing[key] = now
+        self._typing[group].add(username)
+        self._ensure_running()
+        return True
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        self._last_heartbeat = time.monotonic()
+        while self._online or self._has_pending():
+            await asyncio.sleep(self.tick)
+            try:
+                await self._flush()
+                if time.monotonic() - self._last_heartbeat >= self.heartbeat:
+                    self._last_heartbeat = time.monotonic()
+                    await self._send_heartbeats()
+            except Exception:
+                logger.exception("オンライン状況の送信に失敗しました")
+
+    def _has_pending(self):
+        return any(
+            pending
+            for changes in (self._joined, self._left, self._typing, self._snapshot_to)
+            for pending in changes.values()
+        )
+
+    def _take(self, changes):
+        taken = {group: pending for group, pending in changes.items() if pending}
+        changes.clear()
+        return taken
+
+    async def _flush(self):
+        joined = self._take(self._joined)
+        left = self._take(self._left)
+        typing = self._take(self._typing)
+        snapshot_to = self._take(self._snapshot_to)
+
+        channel_layer = get_channel_layer()
+        for group in set(joined) | set(left) | set(typing) | set(snapshot_to):
+            event = group_event(
+                "presence_diff",
+                {
+                    "type": "presence_diff",
+                    "source": self.source,
+                    "joined": sorted(joined.get(group, ())),
+                    "left": sorted(left.get(group, ())),
+                    "typing": sorted(typing.get(group, ())),
+                },
+            )
+            # 一覧の直接送信に使う値はブラウザには送らない
+            event["event_id"] = uuid.uuid4().hex
+            event["snapshot_to"] = snapshot_to.get(group, [])
+            await channel_layer.group_send(group, event)
+
+    def _roster_event(self, group):
+        return group_event(
+            "presence_roster",
+            {
+                "type": "presence_roster",
+                "source": self.source,
+                "online": self.online(group),
+                "ttl": ROSTER_TTL,
+            },
+        )
+
+    async def _send_heartbeats(self):
+        channel_layer = get_channel_layer()
+        for group in list(self._online):
+            await channel_layer.group_send(group, self._roster_event(group))
+
+    async def answer_snapshot(self, group, event):
+        """新しく参加した接続へ、このプロセスの一覧を1回だけ直接送る
+
+        presence_diff はこのプロセスのルーム内の全接続に届くので、最初の1件で送信済みにする。
+        """
+        event_id = event["event_id"]
+        if not event["snapshot_to"] or event_id in self._answered_set:
+            return
+        if len(self._answered) == self._answered.maxlen:
+            self._answered_set.discard(self._answered[0])
+        self._answered.append(event_id)
+        self._answered_set.add(event_id)
+
+        if group not in self._online:
+            return
+        channel_layer = get_channel_layer()
+        roster = self._roster_event(group)
+        for channel_name in event["snapshot_to"]:
+            try:
+                await channel_layer.send(channel_name, roster)
+            except ChannelFull:
+                logger.warning("オンライン一覧を送れませんでした: %s", channel_name)
+
+
+presence = PresenceTracker()
@@ -2,5 +2,7 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    re_path(r"^ws/chat/(?P<room_name>[-\w]+)/$", consumers.ChatConsumer.as_asgi()),
+    # ルーム導入前の URL は既定のルームにつなぐ
     re_path(r"^ws/chat/$", consumers.ChatConsumer.as_asgi()),
 ]
@@ -1,3 +1,284 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from python_apps_django.websocket import event_payload
+
+from . import persistence
+from .consumers import ChatConsumer
+from .models import Message, Room
+from .persistence import MessageWriteBuffer
+from .presence import ROSTER_TTL, PresenceTracker
+
+GROUP = "chat_test"
+
+
+class PresenceTrackerTests(SimpleTestCase):
+    """参加・退出・入力中の変化のまとめ方と、一覧の直接送信"""
+
+    def setUp(self):
+        self.layer = InMemoryChannelLayer()
+        patcher = mock.patch("work12.presence.get_channel_layer", return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # tick は待たずに、テストから _flush() を呼んで進める
+        self.tracker = PresenceTracker(tick=3600, typing_throttle=3600)
+        self.listener = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(GROUP, self.listener)
+
+    async def receive(self, channel=None):
+        event = await asyncio.wait_for(self.layer.receive(channel or self.listener), 1)
+        return event, event_payload(event)
+
+    async def assert_nothing_sent(self, channel=None):
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.layer.receive(channel or self.listener), 0.05)
+
+    async def test_changes_are_batched_into_one_diff(self):
+        self.tracker.join(GROUP, "alice", "chan.a1")
+        self.tracker.join(GROUP, "alice", "chan.a2")
+        self.tracker.join(GROUP, "bob", "chan.b")
+        await self.tracker._flush()
+
+        event, payload = await self.receive()
+        self.assertEqual(payload["joined"], ["alice", "bob"])
+        self.assertEqual(event["snapshot_to"], ["chan.a1", "chan.a2", "chan.b"])
+        await self.assert_nothing_sent()
+
+    async def test_join_and_leave_in_one_tick_cancel_out(self):
+        self.tracker.join(GROUP, "alice", "chan.a")
+        await self.tracker._flush()
+        await self.receive()
+
+        # 退出して同じ tick のうちに戻ってきた
+        self.tracker.leave(GROUP, "alice")
+        self.tracker.join(GROUP, "alice", "chan.a2")
+        await self.tracker._flush()
+        _, payload = await self.receive()
+        self.assertEqual((payload["joined"], payload["left"]), ([], []))
+
+        # 参加してすぐ退出した
+        self.tracker.join(GROUP, "bob", "chan.b")
+        self.tracker.leave(GROUP, "bob")
+        await self.tracker._flush()
+        _, payload = await self.receive()
+        self.assertEqual((payload["joined"], payload["left"]), ([], []))
+
+    async def test_leave_is_sent_when_last_connection_closes(self):
+        self.tracker.join(GROUP, "alice", "chan.a1")
+        self.tracker.join(GROUP, "alice", "chan.a2")
+        await self.tracker._flush()
+        await self.receive()
+
+        self.tracker.leave(GROUP, "alice")
+        await self.tracker._flush()
+        await self.assert_nothing_sent()
+
+        self.tracker.leave(GROUP, "alice")
+        await self.tracker._flush()
+        _, payload = await self.receive()
+        self.assertEqual(payload["left"], ["alice"])
+        self.assertEqual(self.tracker.online(GROUP), [])
+
+    async def test_typing_is_throttled(self):
+        self.tracker.join(GROUP, "alice", "chan.a")
+        await self.tracker._flush()
+        await self.receive()
+
+        self.assertTrue(self.tracker.typing(GROUP, "alice"))
+        self.assertFalse(self.tracker.typing(GROUP, "alice"))
+        await self.tracker._flush()
+        _, payload = await self.receive()
+        self.assertEqual(payload["typing"], ["alice"])
+
+        # 間隔が過ぎれば再び受け付ける
+        self.tracker.typing_throttle = 0
+        self.assertTrue(self.tracker.typing(GROUP, "alice"))
+
+    async def test_snapshot_is_answered_once_per_process(self):
+        self.tracker.join(GROUP, "alice", "chan.a")
+        newcomer = await self.layer.new_channel()
+        self.tracker.join(GROUP, "bob", newcomer)
+        await self.tracker._flush()
+        event, _ = await self.receive()
+
+        # 同じイベントはこのプロセスの全接続に届く
+        await self.tracker.answer_snapshot(GROUP, event)
+        await self.tracker.answer_snapshot(GROUP, event)
+        _, roster = await self.receive(newcomer)
+        self.assertEqual(roster["online"], ["alice", "bob"])
+        await self.assert_nothing_sent(newcomer)
+
+    async def test_heartbeat_sends_roster_with_ttl(self):
+        self.tracker.join(GROUP, "alice", "chan.a")
+        await self.tracker._send_heartbeats()
+        event, payload = await self.receive()
+        self.assertEqual(event["type"], "presence_roster")
+        self.assertEqual(payload["online"], ["alice"])
+        self.assertEqual(payload["ttl"], ROSTER_TTL)
+        self.assertEqual(payload["source"], self.tracker.source)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ChatConsumerWireFormatTests(SimpleTestCase):
+    """サブプロトコルごとのフレームの形式と、壊れたフレームの扱い"""
+
+    def setUp(self):
+        # ルームの検索・保存・オンライン表示はこのテストの対象外
+        for target, value in (
+            ("work12.consumers.ChatConsumer.get_room_id", mock.AsyncMock(return_value=1)),
+            ("work12.consumers.message_buffer", mock.Mock()),
+            ("work12.consumers.presence", mock.Mock()),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.communicators = []
+
+    async def connect(self, username, subprotocols=None):
+        communicator = WebsocketCommunicator(
+            ChatConsumer.as_asgi(), "/ws/chat/", subprotocols=subprotocols
+        )
+        communicator.scope["user"] = User(username=username)
+        communicator.scope["url_route"] = {"kwargs": {}}
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.communicators.append(communicator)
+        return communicator, subprotocol
+
+    async def disconnect(self):
+        for communicator in self.communicators:
+            await communicator.disconnect()
+
+    async def test_msgpack_client_gets_binary_and_default_client_gets_json(self):
+        packed, subprotocol = await self.connect("alice", subprotocols=["msgpack"])
+        self.assertEqual(subprotocol, "msgpack")
+        plain, subprotocol = await self.connect("bob")
+        self.assertIsNone(subprotocol)
+
+        await plain.send_to(text_data=json.dumps({"message": "こんにちは"}))
+        expected = {"message": "こんにちは", "username": "bob"}
+
+        frame = await packed.receive_output()
+        self.assertNotIn("text", frame)
+        self.assertEqual(msgpack.unpackb(frame["bytes"], raw=False), expected)
+        frame = await plain.receive_output()
+        self.assertNotIn("bytes", frame)
+        self.assertEqual(json.loads(frame["text"]), expected)
+
+        # msgpack のクライアントからの送信も同じ形で届く
+        await packed.send_to(bytes_data=msgpack.packb({"message": "どうも"}))
+        self.assertEqual(
+            json.loads(await plain.receive_from()), {"message": "どうも", "username": "alice"}
+        )
+        await self.disconnect()
+
+    async def test_malformed_frames_are_ignored(self):
+        communicator, _ = await self.connect("alice", subprotocols=["msgpack"])
+        with self.assertLogs("python_apps_django.websocket", "WARNING"):
+            await communicator.send_to(text_data="{not json")
+            await communicator.send_to(bytes_data=b"\xc1")
+            await communicator.send_to(bytes_data=msgpack.packb({"message": "a"}) + b"\x00")
+            await communicator.send_to(text_data=json.dumps(["message"]))
+            await communicator.send_to(text_data=json.dumps({"message": 1}))
+            self.assertTrue(await communicator.receive_nothing())
+
+        # 接続は切れずに使い続けられる
+        await communicator.send_to(text_data=json.dumps({"message": "まだいます"}))
+        frame = await communicator.receive_output()
+        self.assertEqual(msgpack.unpackb(frame["bytes"], raw=False)["message"], "まだいます")
+        await self.disconnect()
+
+
+class MessageWriteBufferTests(TestCase):
+    """件数・時間での保存、失敗時の再試行、終了時の保存"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = Room.objects.create(name="buffer-test", title="テスト")
+
+    def make_buffer(self, flush_size=100, flush_interval=10000):
+        # atexit への登録はテストでは不要
+        with mock.patch("work12.persistence.atexit.register"):
+            return MessageWriteBuffer(flush_size=flush_size, flush_interval=flush_interval)
+
+    def message(self, content, timestamp=None):
+        return Message(
+            room_id=self.room.pk,
+            username="alice",
+            content=content,
+            timestamp=timestamp or timezone.now(),
+        )
+
+    async def saved(self):
+        return [message.content async for message in Message.objects.filter(room=self.room)]
+
+    async def wait_for_flush(self, buffer):
+        # 予約された保存のタスクが作られてから終わるまで待つ
+        await asyncio.sleep(0.01)
+        await asyncio.gather(*buffer._flush_tasks)
+
+    async def test_flushes_when_size_is_reached(self):
+        buffer = self.make_buffer(flush_size=2)
+        buffer.add(self.message("1"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(await self.saved(), [])
+
+        buffer.add(self.message("2"))
+        await self.wait_for_flush(buffer)
+        self.assertEqual(sorted(await self.saved()), ["1", "2"])
+        self.assertEqual(buffer.metrics()["depth"], 0)
+        self.assertEqual(buffer.metrics()["flush_count"], 1)
+
+    async def test_flushes_after_interval(self):
+        buffer = self.make_buffer(flush_interval=50)
+        timestamp = timezone.now() + timedelta(minutes=1)
+        buffer.add(self.message("1", timestamp))
+        await asyncio.sleep(0.01)
+        self.assertEqual(await self.saved(), [])
+
+        await asyncio.sleep(0.06)
+        await self.wait_for_flush(buffer)
+        self.assertEqual(await self.saved(), ["1"])
+        room = await Room.objects.aget(pk=self.room.pk)
+        self.assertEqual(room.last_message_at, timestamp)
+
+    async def test_failed_flush_is_retried(self):
+        buffer = self.make_buffer(flush_interval=20)
+        buffer.add(self.message("1"))
+        with mock.patch.object(persistence, "_bulk_insert", side_effect=DatabaseError):
+            with self.assertLogs("work12.persistence", "ERROR"):
+                await buffer.flush()
+        self.assertEqual(buffer.metrics()["depth"], 1)
+        self.assertEqual(buffer.metrics()["failed_flush_count"], 1)
+
+        # 失敗後に再試行が予約されている
+        await asyncio.sleep(0.03)
+        await self.wait_for_flush(buffer)
+        self.assertEqual(await self.saved(), ["1"])
+        self.assertEqual(buffer.metrics()["depth"], 0)
+
+    def test_flush_sync_saves_pending_and_unfinished_batches(self):
+        buffer = self.make_buffer()
+        buffer._pending.append(self.message("1"))
+        # イベントループが止まり、保存中のバッチの結果を受け取れなかった
+        unfinished = [self.message("2")]
+        buffer._in_flight[id(unfinished)] = unfinished
+
+        buffer.flush_sync()
+        self.assertEqual(
+            sorted(Message.objects.filter(room=self.room).values_list("content", flat=True)),
+            ["1", "2"],
+        )
+        buffer.flush_sync()
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 2)
@@ -4,5 +4,8 @@ from . import views
 app_name = 'work12'
 
 urlpatterns = [
-    path('', views.chat_room, name='chat_room'),
+    path('', views.room_list, name='room_list'),
+    path('metrics/', views.buffer_metrics, name='buffer_metrics'),
+    path('<slug:room_name>/', views.chat_room, name='chat_room'),
+    path('<slug:room_name>/history/', views.message_history, name='message_history'),
 ]
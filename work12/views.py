@@ -1,9 +1,108 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, redirect, render
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from .models import Message
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from .forms import RoomCreateForm
+from .models import Room
+from .persistence import message_buffer
+
+# 最初に表示する件数と、さかのぼって読み込む1回あたりの件数
+HISTORY_PAGE_SIZE = 50
+
+# ルーム一覧の1ページの件数
+ROOM_PAGE_SIZE = 30
+
+
+def _older_messages(room, before_id=None):
+    """before_id より前のルームのメッセージを新しい順に1ページ分取得（インデックスを降順に読む）"""
+    messages = room.messages.order_by('-timestamp', '-id')
+    if before_id is not None:
+        anchor = room.messages.filter(id=before_id).values_list('timestamp', flat=True).first()
+        if anchor is None:
+            return [], False
+        messages = messages.filter(Q(timestamp__lt=anchor) | Q(timestamp=anchor, id__lt=before_id))
+    page = list(messages[:HISTORY_PAGE_SIZE + 1])
+    return page[:HISTORY_PAGE_SIZE], len(page) > HISTORY_PAGE_SIZE
+
+
+def _less_active_rooms(before_id=None):
+    """before_id より後ろ（最終発言が古い）のルームを1ページ分取得（インデックスを降順に読む）"""
+    rooms = Room.objects.order_by('-last_message_at', '-id')
+    if before_id is not None:
+        anchor = Room.objects.filter(id=before_id).values_list('last_message_at', flat=True).first()
+        if anchor is None:
+            return [], False
+        rooms = rooms.filter(
+            Q(last_message_at__lt=anchor) | Q(last_message_at=anchor, id__lt=before_id)
+        )
+    page = list(rooms[:ROOM_PAGE_SIZE + 1])
+    return page[:ROOM_PAGE_SIZE], len(page) > ROOM_PAGE_SIZE
 
 
 @login_required
-def chat_room(request):
-    messages = Message.objects.all()[:50]  # 最新50件のメッセージを取得
-    return render(request, 'work12/chat.html', {'messages': messages})
+def room_list(request):
+    """ルーム一覧（最後に発言があった順）"""
+    if request.method == 'POST':
+        form = RoomCreateForm(request.POST)
+        if form.is_valid():
+            room = form.save()
+            return redirect('work12:chat_room', room_name=room.name)
+    else:
+        form = RoomCreateForm()
+
+    try:
+        before_id = int(request.GET['before'])
+    except (KeyError, ValueError):
+        before_id = None
+
+    # last_message_at は保存時に更新される非正規化列なので、メッセージ表は読まない
+    rooms, has_more = _less_active_rooms(before_id)
+    return render(request, 'work12/room_list.html', {
+        'rooms': rooms,
+        'has_more': has_more,
+        'form': form,
+    })
+
+
+@login_required
+def chat_room(request, room_name):
+    room = get_object_or_404(Room, name=room_name)
+    # 最新50件を取得し、古い順に並べ替えて表示
+    messages, has_more = _older_messages(room)
+    return render(request, 'work12/chat.html', {
+        'room': room,
+        'messages': messages[::-1],
+        'has_more': has_more,
+    })
+
+
+@login_required
+def message_history(request, room_name):
+    """過去のメッセージ（?before=<id> より前の1ページ分、古い順の JSON）"""
+    room = get_object_or_404(Room, name=room_name)
+    try:
+        before_id = int(request.GET['before'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'before を指定してください'}, status=400)
+
+    messages, has_more = _older_messages(room, before_id)
+    return JsonResponse({
+        'messages': [
+            {
+                'id': message.id,
+                'username': message.username,
+                'content': message.content,
+                'timestamp': timezone.localtime(message.timestamp).strftime('%H:%M'),
+            }
+            for message in reversed(messages)
+        ],
+        'has_more': has_more,
+    })
+
+
+@staff_member_required
+def buffer_metrics(request):
+    """メッセージ書き込みバッファの状態（このプロセス分）"""
+    return JsonResponse(message_buffer.metrics())
@@ -1,23 +1,114 @@
 from django.contrib import admin
+from django.contrib.admin.utils import get_last_value_from_parameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from .models import UserProfile, Post, Like, Comment, Follow
 
 
+def _estimated_row_count(queryset):
+    """テーブル統計から概算の行数を取得（取得できなければ None）"""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """件数の COUNT(*) を避ける管理画面用ページネーター
+
+    絞り込みのない一覧はテーブル統計の概算件数を使い、
+    絞り込みがある場合も COUNT_LIMIT 件で数えるのをやめる。
+    """
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = _estimated_row_count(queryset)
+            # 小さいテーブルは概算の誤差が目立つので正確に数える
+            if estimate is not None and estimate >= self.COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:self.COUNT_LIMIT].count()
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """全ユーザーをリストに並べず、オートコンプリートで絞り込むフィルター"""
+    template = 'admin/work13/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.attname}__exact'
+        self.lookup_val = get_last_value_from_parameters(params, self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.form_field = field.formfield(
+            widget=AutocompleteSelect(field, model_admin.admin_site), required=False
+        )
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'すべて',
+        }
+
+    def rendered_widget(self):
+        return self.form_field.widget.render(
+            self.lookup_kwarg, self.lookup_val, attrs={'id': f'filter_{self.lookup_kwarg}'}
+        )
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """大きなテーブル向けの共通設定（概算件数・ファセットなし）"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    @property
+    def media(self):
+        # AutocompleteFilter 用の select2 を一覧画面でも読み込む
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'created_at']
+    list_display = ['user', 'post_count', 'follower_count', 'following_count', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['user']
     search_fields = ['user__username', 'user__email']
-    readonly_fields = ['created_at']
+    readonly_fields = ['created_at', 'post_count', 'follower_count', 'following_count']
+    autocomplete_fields = ['user']
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableModelAdmin):
+    # いいね数・コメント数は非正規化カウンター列なので行ごとの COUNT は発生しない
     list_display = ['author', 'caption_preview', 'created_at', 'like_count', 'comment_count']
-    list_filter = ['created_at', 'author']
+    list_filter = ['created_at', ('author', AutocompleteFilter)]
+    list_select_related = ['author']
     search_fields = ['author__username', 'caption']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'like_count', 'comment_count']
+    autocomplete_fields = ['author']
     ordering = ['-created_at']
-    
+
     def caption_preview(self, obj):
         """キャプションのプレビュー表示"""
         if obj.caption:
@@ -27,22 +118,26 @@ class PostAdmin(admin.ModelAdmin):
 
 
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(ScalableModelAdmin):
     list_display = ['user', 'post', 'created_at']
-    list_filter = ['created_at']
+    list_filter = ['created_at', ('user', AutocompleteFilter)]
+    list_select_related = ['user', 'post__author']
     search_fields = ['user__username', 'post__author__username']
     readonly_fields = ['created_at']
+    autocomplete_fields = ['user', 'post']
     ordering = ['-created_at']
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableModelAdmin):
     list_display = ['user', 'post', 'content_preview', 'created_at']
-    list_filter = ['created_at']
+    list_filter = ['created_at', ('user', AutocompleteFilter)]
+    list_select_related = ['user', 'post__author']
     search_fields = ['user__username', 'post__author__username', 'content']
     readonly_fields = ['created_at', 'updated_at']
+    autocomplete_fields = ['user', 'post']
     ordering = ['-created_at']
-    
+
     def content_preview(self, obj):
         """コメント内容のプレビュー表示"""
         return obj.content[:30] + '...' if len(obj.content) > 30 else obj.content
@@ -50,9 +145,11 @@ class CommentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableModelAdmin):
     list_display = ['follower', 'following', 'created_at']
-    list_filter = ['created_at']
+    list_filter = ['created_at', ('follower', AutocompleteFilter), ('following', AutocompleteFilter)]
+    list_select_related = ['follower', 'following']
     search_fields = ['follower__username', 'following__username']
     readonly_fields = ['created_at']
+    autocomplete_fields = ['follower', 'following']
     ordering = ['-created_at']
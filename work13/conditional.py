@@ -0,0 +1,113 @@
+"""投稿詳細・プロフィールの条件付き GET（ETag）
+
+画面の表示に関わる値だけを数本の細いクエリで読み、ハッシュして ETag にする。
+投稿本体・コメント・グリッドの描画は行わないので、ブラウザのキャッシュが
+最新なら 304 Not Modified を描画なしで返せる。
+
+ETag に含めるもの:
+- 投稿の updated_at と非正規化カウンター（いいね数・コメント数など）
+- コメントの最大 id と最新の updated_at。カウンターの更新は投稿の updated_at を
+  進めないので、同じ秒にコメントを1件消して1件足す（件数が変わらない）場合や
+  コメントの編集はこれで検出する
+- 閲覧ユーザーごとに変わる表示（いいね済み・フォロー中・未読バッジ）
+- CSRF の秘密値（ログインし直すとフォームのトークンが変わるため）
+
+表示待ちのメッセージ（messages フレームワーク）がある場合は ETag を付けない。
+"""
+
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+
+from .feed_cache import csrf_secret_digest
+from .models import Comment, Follow, FollowSuggestion, Like, Post, UserProfile
+
+
+def _digest(*parts):
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def _viewer_parts(request):
+    """閲覧ユーザーの未読バッジと CSRF トークン"""
+    user = request.user
+    if not user.is_authenticated:
+        return (None, csrf_secret_digest(request))
+    # プロフィールのないユーザー（createsuperuser で作ったものなど）でも失敗させない
+    unread = (
+        UserProfile.objects.filter(user=user)
+        .values_list("unread_notification_count", flat=True)
+        .first()
+    )
+    return (user.pk, unread or 0, csrf_secret_digest(request))
+
+
+def post_detail_etag(request, post_id):
+    if get_messages(request):
+        return None
+    row = (
+        Post.objects.filter(pk=post_id)
+        .values_list(
+            "updated_at",
+            "like_count",
+            "comment_count",
+            "image_rendition",
+            "image_rendition_width",
+            "author__userprofile__avatar_rendition",
+            "author__userprofile__avatar_rendition_width",
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    comments = Comment.objects.filter(post_id=post_id).aggregate(
+        last_id=Max("id"), latest=Max("updated_at")
+    )
+    liked = (
+        request.user.is_authenticated
+        and Like.objects.filter(user=request.user, post_id=post_id).exists()
+    )
+    return _digest(
+        "post", post_id, row, comments["last_id"], comments["latest"], liked, _viewer_parts(request)
+    )
+
+
+def user_profile_etag(request, username, grid_size):
+    # 2ページ目以降（カーソル付き）は対象外
+    if request.GET or get_messages(request):
+        return None
+    profile = (
+        UserProfile.objects.filter(user__username=username)
+        .values_list(
+            "user_id",
+            "bio",
+            "avatar",
+            "avatar_rendition",
+            "avatar_rendition_width",
+            "post_count",
+            "follower_count",
+            "following_count",
+        )
+        .first()
+    )
+    if profile is None:
+        return None
+    user_id = profile[0]
+    grid = list(
+        Post.objects.filter(author_id=user_id)
+        .order_by("-created_at", "-id")
+        .values_list(
+            "id", "image_rendition", "image_rendition_width", "like_count", "comment_count"
+        )[:grid_size]
+    )
+
+    viewer = ()
+    if request.user.is_authenticated:
+        is_following = Follow.objects.filter(
+            follower=request.user, following_id=user_id
+        ).exists()
+        suggestions = FollowSuggestion.objects.filter(user=request.user).aggregate(
+            count=Count("id"), latest=Max("created_at")
+        )
+        viewer = (is_following, suggestions["count"], suggestions["latest"])
+    return _digest("profile", profile, grid, viewer, _viewer_parts(request))
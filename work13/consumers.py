@@ -1,16 +1,25 @@
-import json
-from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
-from .models import Post, Like, Comment
+from channels.generic.websocket import AsyncWebsocketConsumer
+from python_apps_django.websocket import WireFormatMixin
+from .notifications import mark_all_read, notification_group_name
+from .realtime import feed_group_name
 
 
-class LiveFeedConsumer(AsyncWebsocketConsumer):
-    """リアルタイムフィード用のWebSocketコンシューマー"""
+class LiveFeedConsumer(WireFormatMixin, AsyncWebsocketConsumer):
+    """リアルタイムフィード用のWebSocketコンシューマー
+
+    接続ごとに自分専用の feed_user_<id> グループに参加し、
+    フォローしているユーザーと自分の新着投稿だけを受け取る。
+    """
     
     async def connect(self):
-        self.room_name = 'live_feed'
-        self.room_group_name = f'feed_{self.room_name}'
+        self.user = self.scope["user"]
+
+        if self.user.is_anonymous:
+            await self.close()
+            return
+
+        self.room_group_name = feed_group_name(self.user.id)
 
         # グループに参加
         await self.channel_layer.group_add(
@@ -21,39 +30,23 @@ class LiveFeedConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
-        # グループから離脱
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
-
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message_type = text_data_json.get('type')
-
-        if message_type == 'new_post':
-            # 新しい投稿があったことをブロードキャスト
-            await self.channel_layer.group_send(
+        if hasattr(self, 'room_group_name'):
+            # グループから離脱
+            await self.channel_layer.group_discard(
                 self.room_group_name,
-                {
-                    'type': 'new_post_notification',
-                    'post_id': text_data_json.get('post_id'),
-                    'author': text_data_json.get('author'),
-                    'message': '新しい投稿があります！'
-                }
+                self.channel_name
             )
 
+    async def receive(self, text_data=None, bytes_data=None):
+        # 新着投稿は create_post からサーバー側でフォロワーへ送信する
+        pass
+
     async def new_post_notification(self, event):
-        # フロントエンドに新しい投稿の通知を送信
-        await self.send(text_data=json.dumps({
-            'type': 'new_post',
-            'post_id': event['post_id'],
-            'author': event['author'],
-            'message': event['message']
-        }))
+        # フロントエンドに新しい投稿の通知を送信（送信側でエンコード済み）
+        await self.send_frames(event)
 
 
-class PostConsumer(AsyncWebsocketConsumer):
+class PostConsumer(WireFormatMixin, AsyncWebsocketConsumer):
     """個別投稿のリアルタイム更新用WebSocketコンシューマー"""
     
     async def connect(self):
@@ -75,82 +68,21 @@ class PostConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message_type = text_data_json.get('type')
-
-        if message_type == 'like_update':
-            # いいね数の更新をブロードキャスト
-            post_id = text_data_json.get('post_id')
-            user_id = text_data_json.get('user_id')
-            
-            # データベースから最新のいいね数を取得
-            like_count = await self.get_like_count(post_id)
-            
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'like_count_update',
-                    'post_id': post_id,
-                    'like_count': like_count,
-                    'user_id': user_id
-                }
-            )
-
-        elif message_type == 'new_comment':
-            # 新しいコメントをブロードキャスト
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'comment_notification',
-                    'post_id': text_data_json.get('post_id'),
-                    'comment_id': text_data_json.get('comment_id'),
-                    'author': text_data_json.get('author'),
-                    'content': text_data_json.get('content'),
-                    'created_at': text_data_json.get('created_at')
-                }
-            )
+    async def receive(self, text_data=None, bytes_data=None):
+        # いいね・コメントはビューからサーバー側で送信するため、
+        # ブラウザからの通知は受け付けない（work13.realtime を参照）
+        pass
 
     async def like_count_update(self, event):
-        # いいね数の更新をフロントエンドに送信
-        await self.send(text_data=json.dumps({
-            'type': 'like_update',
-            'post_id': event['post_id'],
-            'like_count': event['like_count'],
-            'user_id': event['user_id']
-        }))
+        # いいね数の更新をフロントエンドに送信（送信側でエンコード済み）
+        await self.send_frames(event)
 
     async def comment_notification(self, event):
-        # 新しいコメントをフロントエンドに送信
-        await self.send(text_data=json.dumps({
-            'type': 'new_comment',
-            'post_id': event['post_id'],
-            'comment_id': event['comment_id'],
-            'author': event['author'],
-            'content': event['content'],
-            'created_at': event['created_at']
-        }))
-
-    @database_sync_to_async
-    def get_like_count(self, post_id):
-        """投稿のいいね数を取得"""
-        try:
-            post = Post.objects.get(id=post_id)
-            return post.like_count()
-        except Post.DoesNotExist:
-            return 0
-
-    @database_sync_to_async
-    def get_comment_count(self, post_id):
-        """投稿のコメント数を取得"""
-        try:
-            post = Post.objects.get(id=post_id)
-            return post.comment_count()
-        except Post.DoesNotExist:
-            return 0
-
-
-class NotificationConsumer(AsyncWebsocketConsumer):
+        # 新しいコメントをフロントエンドに送信（送信側でエンコード済み）
+        await self.send_frames(event)
+
+
+class NotificationConsumer(WireFormatMixin, AsyncWebsocketConsumer):
     """ユーザー通知用WebSocketコンシューマー"""
     
     async def connect(self):
@@ -159,7 +91,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         if self.user.is_anonymous:
             await self.close()
         else:
-            self.room_group_name = f'user_{self.user.id}_notifications'
+            self.room_group_name = notification_group_name(self.user.id)
 
             # グループに参加
             await self.channel_layer.group_add(
@@ -177,16 +109,16 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
 
-    async def receive(self, text_data):
-        # 通知の既読処理など
-        pass
+    async def receive(self, text_data=None, bytes_data=None):
+        # 通知の既読処理
+        text_data_json = self.decode(text_data, bytes_data)
+        if text_data_json is not None and text_data_json.get('type') == 'mark_read':
+            await database_sync_to_async(mark_all_read)(self.user)
+            await self.send_payload({
+                'type': 'unread_count',
+                'unread_count': 0
+            })
 
     async def notification_message(self, event):
-        # 通知をフロントエンドに送信
-        await self.send(text_data=json.dumps({
-            'type': 'notification',
-            'notification_type': event['notification_type'],
-            'message': event['message'],
-            'from_user': event.get('from_user'),
-            'post_id': event.get('post_id')
-        }))
+        # 通知をフロントエンドに送信（送信側でエンコード済み）
+        await self.send_frames(event)
@@ -0,0 +1,45 @@
+"""非正規化カウンターの再計算
+
+通常は Like/Comment/Post/Follow のシグナル（いいね・コメントの削除は delete()）で
+F() による増減を行うが、データ移行や不整合の修復時にはここで集計し直す。
+"""
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Like, Notification, Post, UserProfile
+
+
+def _count_subquery(model, field, outer="pk", **filters):
+    counts = (
+        model.objects.filter(**{field: OuterRef(outer)}, **filters)
+        .order_by()
+        .values(field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def rebuild_post_counters(posts=None):
+    """投稿のいいね数・コメント数を集計し直し、更新件数を返す"""
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.update(
+        like_count=_count_subquery(Like, "post"),
+        comment_count=_count_subquery(Comment, "post"),
+    )
+
+
+def rebuild_profile_counters(profiles=None):
+    """プロフィールの投稿数・フォロワー数・フォロー数・未読通知数を集計し直し、更新件数を返す"""
+    if profiles is None:
+        profiles = UserProfile.objects.all()
+    return profiles.update(
+        post_count=_count_subquery(Post, "author", "user_id"),
+        follower_count=_count_subquery(Follow, "following", "user_id"),
+        following_count=_count_subquery(Follow, "follower", "user_id"),
+        unread_notification_count=_count_subquery(
+            Notification, "recipient", "user_id", is_read=False
+        ),
+    )
@@ -0,0 +1,148 @@
+"""ホームタイムライン1ページ目の描画済み HTML キャッシュ
+
+ログインユーザーごとに、1ページ目の投稿一覧（_home_feed.html）を描画済みの
+HTML としてキャッシュし、再訪時はタイムラインのクエリも描画も行わない。
+
+無効化は2種類のバージョンで行う。
+
+- ユーザーのバージョン: タイムラインの中身が変わったら更新する
+  （フォローしている人の新規投稿、フォロー・フォロー解除）
+- 投稿のバージョン: 投稿の表示が変わったら更新する
+  （いいね数・コメント数の増減、削除）
+
+キャッシュには表示した投稿IDとその時点の投稿のバージョンを一緒に保存し、
+読み出し時に get_many 1回で照合する。フォロワー全員のキャッシュを
+いいねのたびに消して回る必要はない。
+閲覧ユーザー自身のいいねも投稿のバージョンを更新するので、いいねボタンの状態も古くならない。
+まだバージョンのない投稿は読み出し時に初期値を入れてから照合するので、
+バージョンの鍵が追い出されても「なし」同士で一致して古い HTML を返すことはない。
+
+フォロワー全員分のユーザーのバージョン更新は、ファイルキャッシュへの書き込みが
+フォロワー数に比例するため、リクエストのスレッドではなく別スレッドで行う。
+ただし操作したユーザー本人の分はリクエストのスレッドで行う（timeline._invalidate_home）。
+"""
+
+import hashlib
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+
+logger = logging.getLogger(__name__)
+
+HOME_CACHE_TIMEOUT = 300
+
+# ユーザーのバージョン更新は到着順に1本のスレッドで行う
+_bump_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="work13-home-cache")
+
+
+def _user_version_key(user_id):
+    return f"work13:home:user:{user_id}"
+
+
+def _post_version_key(post_id):
+    return f"work13:home:post:{post_id}"
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def bump_home_versions(user_ids):
+    """ユーザーのタイムラインが変わったことを記録する"""
+    cache.set_many(
+        {_user_version_key(user_id): _new_version() for user_id in user_ids},
+        HOME_CACHE_TIMEOUT,
+    )
+
+
+def _bump_home_versions_logged(user_ids):
+    try:
+        bump_home_versions(user_ids)
+    except Exception:
+        logger.exception("ホームのキャッシュの無効化に失敗しました（%d人）", len(user_ids))
+
+
+def bump_home_versions_later(user_ids):
+    """bump_home_versions を別スレッドで行う"""
+    _bump_executor.submit(_bump_home_versions_logged, list(user_ids))
+
+
+def wait_for_home_bumps():
+    """予約済みのユーザーのバージョン更新が終わるまで待つ（テスト用）"""
+    _bump_executor.submit(lambda: None).result()
+
+
+def bump_post_versions(post_ids):
+    """投稿の表示（いいね数・コメント数など）が変わったことを記録する"""
+    cache.set_many(
+        {_post_version_key(post_id): _new_version() for post_id in post_ids},
+        HOME_CACHE_TIMEOUT,
+    )
+
+
+def _user_version(user_id):
+    key = _user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), HOME_CACHE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def _post_versions(post_ids):
+    """投稿のバージョン（なければ初期値を入れる）。キャッシュに書けなければ None"""
+    keys = [_post_version_key(post_id) for post_id in post_ids]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), HOME_CACHE_TIMEOUT)
+        versions.update(cache.get_many(missing))
+        if len(versions) < len(keys):
+            return None
+    return {key: versions[key] for key in sorted(keys)}
+
+
+def csrf_secret_digest(request):
+    """CSRF の秘密値のダイジェスト
+
+    描画済み HTML のトークンはログインし直すと無効になるため、キャッシュの鍵や ETag に含める。
+    """
+    get_token(request)
+    secret = request.META.get("CSRF_COOKIE", "")
+    return hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+
+def _page_key(request, version):
+    return f"work13:home:page:{request.user.id}:{version}:{csrf_secret_digest(request)}"
+
+
+def cached_home_feed(request, load_posts, render):
+    """1ページ目の HTML を返す
+
+    キャッシュが無効なら load_posts() で投稿を読み、render(posts) で描画して保存する。
+    """
+    # 描画中にタイムラインが変わったら次回は別の鍵になるよう、バージョンは先に読む
+    key = _page_key(request, _user_version(request.user.id))
+    entry = cache.get(key)
+    if entry is not None:
+        post_versions = _post_versions(entry["post_ids"])
+        if post_versions is not None and post_versions == entry["post_versions"]:
+            return entry["html"]
+
+    posts = load_posts()
+    post_ids = [post.id for post in posts]
+    # 投稿のバージョンは読み込み直後に控え、描画中の更新は次回の照合で検出する
+    post_versions = _post_versions(post_ids)
+    html = render(posts)
+    if post_versions is None:
+        return html
+    cache.set(
+        key,
+        {"post_ids": post_ids, "post_versions": post_versions, "html": html},
+        HOME_CACHE_TIMEOUT,
+    )
+    return html
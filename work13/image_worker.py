@@ -0,0 +1,134 @@
+"""アップロード画像のリサイズをリクエスト外で行うワーカー
+
+以前は Post.save() / UserProfile.save() の中で Pillow による縮小を行っており、
+大きな写真だとその間 gunicorn のワーカーが塞がっていた。
+現在はアップロードされたファイルをそのまま保存して状態を pending にし、
+トランザクション確定後にプロセスプールへ処理を投げる。
+処理が終わると状態を ready（失敗時は failed）に更新する。
+
+WORK13_IMAGE_WORKERS 設定でプロセス数を指定する（0 ならその場で同期処理）。
+"""
+
+import logging
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+
+from .renditions import build_renditions
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PENDING = "pending"
+IMAGE_READY = "ready"
+IMAGE_FAILED = "failed"
+IMAGE_STATUS_CHOICES = [
+    (IMAGE_PENDING, "処理待ち"),
+    (IMAGE_READY, "処理済み"),
+    (IMAGE_FAILED, "処理失敗"),
+]
+
+# 画像フィールドごとの処理内容
+#   field: ImageField 名 / status_field: 処理状態 / rendition_field: レンディションのキー
+#   width_field: 生成したレンディションの最大の幅
+#   max_size: 元画像の最大辺 / widths: 生成するレンディションの幅（元画像より大きいものは作らない）
+ImageSpec = namedtuple(
+    "ImageSpec",
+    ["field", "status_field", "rendition_field", "width_field", "max_size", "widths"],
+)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=_worker_count())
+    return _executor
+
+
+def _worker_count():
+    return getattr(settings, "WORK13_IMAGE_WORKERS", 2)
+
+
+def resize_image(path, max_size):
+    """画像を max_size 四方に収まるよう縮小して上書き"""
+    with Image.open(path) as img:
+        image_format = img.format
+        img = ImageOps.exif_transpose(img)
+        if img.height > max_size or img.width > max_size:
+            img.thumbnail((max_size, max_size))
+            img.save(path, format=image_format)
+
+
+def process_image(path, max_size, widths, media_root):
+    """縮小とレンディション生成を行い、キーと最大の幅を返す（ワーカープロセスで実行）"""
+    resize_image(path, max_size)
+    return build_renditions(path, widths, media_root)
+
+
+def _record(model, pk, spec, file_name, rendition):
+    status = IMAGE_READY if rendition else IMAGE_FAILED
+    values = {spec.status_field: status}
+    if rendition:
+        values[spec.rendition_field], values[spec.width_field] = rendition
+    # 処理中に差し替えられていれば新しい方の処理に任せる
+    model.objects.filter(pk=pk, **{spec.field: file_name}).update(**values)
+    return status
+
+
+def _mark_done(model, pk, spec, file_name, future):
+    # プロセスプールの管理スレッドで呼ばれるので、使った接続はその場で閉じる
+    close_old_connections()
+    try:
+        try:
+            rendition = future.result()
+        except Exception:
+            logger.exception("画像処理に失敗しました: %s", file_name)
+            rendition = None
+        _record(model, pk, spec, file_name, rendition)
+    except Exception:
+        logger.exception("画像処理の結果を保存できませんでした: %s", file_name)
+    finally:
+        connection.close()
+
+
+def process_now(instance, spec):
+    """同期的に処理する（ワーカー0設定時や保留分の再処理用）"""
+    field_file = getattr(instance, spec.field)
+    try:
+        rendition = process_image(
+            field_file.path, spec.max_size, spec.widths, str(settings.MEDIA_ROOT)
+        )
+    except Exception:
+        logger.exception("画像処理に失敗しました: %s", field_file.name)
+        rendition = None
+    return _record(type(instance), instance.pk, spec, field_file.name, rendition)
+
+
+def _submit(model, pk, spec):
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    field_file = getattr(instance, spec.field)
+    if not field_file:
+        return
+    if _worker_count() == 0:
+        process_now(instance, spec)
+        return
+    future = _get_executor().submit(
+        process_image,
+        field_file.path,
+        spec.max_size,
+        spec.widths,
+        str(settings.MEDIA_ROOT),
+    )
+    future.add_done_callback(partial(_mark_done, model, pk, spec, field_file.name))
+
+
+def enqueue(instance, spec):
+    """コミット後に画像処理を予約する"""
+    transaction.on_commit(partial(_submit, type(instance), instance.pk, spec))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from work13.suggestions import TOP_K, build_follow_suggestions
+
+
+class Command(BaseCommand):
+    help = "フォローグラフと共通のいいねから「知り合いかも」のおすすめを一括計算する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k", type=int, default=TOP_K, help="1ユーザーあたりの保存件数"
+        )
+
+    def handle(self, *args, **options):
+        users, saved = build_follow_suggestions(top_k=options["top_k"])
+        self.stdout.write(
+            self.style.SUCCESS(f"{users}人分のおすすめを計算し、{saved}件を保存しました")
+        )
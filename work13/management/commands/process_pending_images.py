@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from work13.image_worker import IMAGE_FAILED, IMAGE_PENDING, IMAGE_READY, process_now
+from work13.models import AVATAR_SPEC, POST_IMAGE_SPEC, Post, UserProfile
+
+
+class Command(BaseCommand):
+    help = "処理待ち・失敗・レンディション未生成（最大幅の記録なしを含む）の画像をこのプロセスで処理し直す"
+
+    def handle(self, *args, **options):
+        targets = [(Post, POST_IMAGE_SPEC), (UserProfile, AVATAR_SPEC)]
+        for model, spec in targets:
+            # 処理待ち・失敗に加え、レンディション未生成のもの（移行前の画像）と、
+            # 元画像より大きい幅も作っていた頃の画像（最大幅の記録なし）も対象
+            instances = (
+                model.objects.filter(
+                    Q(**{f"{spec.status_field}__in": [IMAGE_PENDING, IMAGE_FAILED]})
+                    | Q(**{spec.rendition_field: ""})
+                    | Q(**{f"{spec.width_field}__isnull": True})
+                )
+                .exclude(**{spec.field: ""})
+                .exclude(**{f"{spec.field}__isnull": True})
+            )
+            ready = total = 0
+            for instance in instances.iterator():
+                total += 1
+                if process_now(instance, spec) == IMAGE_READY:
+                    ready += 1
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{model._meta.verbose_name}: {total}件中{ready}件を処理しました"
+                )
+            )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from work13.counters import rebuild_post_counters, rebuild_profile_counters
+from work13.models import Post
+
+
+class Command(BaseCommand):
+    help = "投稿のいいね数・コメント数と、プロフィールの投稿数・フォロー数カウンターを再計算する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("post_ids", nargs="*", type=int, help="対象の投稿ID（省略時は全件）")
+        parser.add_argument(
+            "--only",
+            choices=["posts", "profiles"],
+            help="片方だけ再計算する（省略時は両方）",
+        )
+
+    def handle(self, *args, **options):
+        if options["only"] in (None, "posts"):
+            posts = Post.objects.all()
+            if options["post_ids"]:
+                posts = posts.filter(id__in=options["post_ids"])
+
+            updated = rebuild_post_counters(posts)
+            self.stdout.write(self.style.SUCCESS(f"{updated}件の投稿カウンターを再計算しました"))
+
+        if options["only"] in (None, "profiles"):
+            updated = rebuild_profile_counters()
+            self.stdout.write(
+                self.style.SUCCESS(f"{updated}件のプロフィールカウンターを再計算しました")
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from work13.models import Post
+from work13.search import index_post
+
+
+class Command(BaseCommand):
+    help = "探索画面の検索インデックス（SearchTerm）を全投稿から作り直す"
+
+    def handle(self, *args, **options):
+        count = 0
+        for post in Post.objects.select_related("author").iterator(chunk_size=500):
+            index_post(post)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{count}件の投稿をインデックスしました"))
@@ -0,0 +1,31 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from work13.timeline import BACKFILL_LIMIT, rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = "ホームタイムライン（TimelineEntry）を Follow と Post から作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames", nargs="*", help="対象ユーザー名（省略時は全ユーザー）"
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=BACKFILL_LIMIT,
+            help="フォロー相手ごとに取り込む投稿数の上限",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+
+        count = 0
+        for user_id in users.values_list("id", flat=True).iterator():
+            rebuild_timeline(user_id, limit=options["limit"])
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{count}人分のタイムラインを再構築しました"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from work13.trending import HALF_LIFE_HOURS, WINDOW_HOURS, update_trending_scores
+
+
+class Command(BaseCommand):
+    help = "explore のトレンド順に使う trending_score を再計算する（cron などで数分おきに実行）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--half-life", type=float, default=HALF_LIFE_HOURS, help="半減期（時間）"
+        )
+        parser.add_argument(
+            "--window", type=float, default=WINDOW_HOURS, help="集計対象の期間（時間）"
+        )
+
+    def handle(self, *args, **options):
+        updated, cleared = update_trending_scores(
+            half_life_hours=options["half_life"], window_hours=options["window"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{updated}件の投稿のスコアを更新し、{cleared}件を0に戻しました"
+            )
+        )
@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work13', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='投稿日時')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='投稿者')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='work13.post', verbose_name='投稿')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL, verbose_name='受信ユーザー')),
+            ],
+            options={
+                'verbose_name': 'タイムライン',
+                'verbose_name_plural': 'タイムライン',
+                'ordering': ['-created_at', '-post_id'],
+                'indexes': [models.Index(fields=['user', '-created_at', '-post'], name='work13_timeline_user_created'), models.Index(fields=['user', 'author'], name='work13_timeline_user_author')],
+                'unique_together': {('user', 'post')},
+            },
+        ),
+    ]
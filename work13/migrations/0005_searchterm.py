@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work13', '0004_post_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=2, verbose_name='語')),
+                ('field', models.CharField(choices=[('c', 'キャプション'), ('u', 'ユーザー名')], max_length=1, verbose_name='対象')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='出現回数')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='work13.post', verbose_name='投稿')),
+            ],
+            options={
+                'verbose_name': '検索インデックス',
+                'verbose_name_plural': '検索インデックス',
+                'unique_together': {('term', 'post', 'field')},
+            },
+        ),
+    ]
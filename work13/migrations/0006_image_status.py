@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work13', '0005_searchterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_status',
+            field=models.CharField(choices=[('pending', '処理待ち'), ('ready', '処理済み'), ('failed', '処理失敗')], default='ready', editable=False, max_length=10, verbose_name='画像処理状態'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_status',
+            field=models.CharField(choices=[('pending', '処理待ち'), ('ready', '処理済み'), ('failed', '処理失敗')], default='ready', editable=False, max_length=10, verbose_name='画像処理状態'),
+        ),
+    ]
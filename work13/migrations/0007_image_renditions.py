@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work13', '0006_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_rendition',
+            field=models.CharField(blank=True, editable=False, max_length=40, verbose_name='レンディション'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_rendition',
+            field=models.CharField(blank=True, editable=False, max_length=40, verbose_name='レンディション'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    UserProfile = apps.get_model('work13', 'UserProfile')
+    Post = apps.get_model('work13', 'Post')
+    Follow = apps.get_model('work13', 'Follow')
+
+    def count_of(model, field):
+        counts = (
+            model.objects.filter(**{field: OuterRef('user_id')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    UserProfile.objects.update(
+        post_count=count_of(Post, 'author'),
+        follower_count=count_of(Follow, 'following'),
+        following_count=count_of(Follow, 'follower'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work13', '0007_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='投稿数'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='フォロワー数'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='フォロー数'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work13', '0009_comment_post_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='未読通知数'),
+        ),
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('verb', models.CharField(choices=[('like', 'いいね'), ('comment', 'コメント'), ('follow', 'フォロー')], max_length=10, verbose_name='種類')),
+                ('actor_count', models.PositiveIntegerField(default=1, verbose_name='実行者数')),
+                ('is_read', models.BooleanField(default=False, verbose_name='既読')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='最新の実行者')),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='work13.post', verbose_name='投稿')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='通知先')),
+            ],
+            options={
+                'verbose_name': '通知',
+                'verbose_name_plural': '通知',
+                'ordering': ['-updated_at'],
+                'indexes': [models.Index(fields=['recipient', 'is_read', 'verb', 'post'], name='work13_notif_collapse'), models.Index(fields=['recipient', '-updated_at'], name='work13_notif_recipient')],
+            },
+        ),
+    ]
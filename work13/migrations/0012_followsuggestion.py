@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('work13', '0011_post_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='スコア')),
+                ('mutual_count', models.PositiveIntegerField(default=0, verbose_name='共通のフォロー数')),
+                ('co_like_count', models.PositiveIntegerField(default=0, verbose_name='共通のいいね数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='計算日時')),
+                ('suggested', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='おすすめユーザー')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_suggestions', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'おすすめユーザー',
+                'verbose_name_plural': 'おすすめユーザー',
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['user', '-score'], name='work13_suggestion_user')],
+                'unique_together': {('user', 'suggested')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_latest_actors(apps, schema_editor):
+    # 既存の通知は最新の実行者だけが分かるので、その人を数え済みにする
+    Notification = apps.get_model('work13', 'Notification')
+    NotificationActor = apps.get_model('work13', 'NotificationActor')
+    rows = Notification.objects.values_list('id', 'actor_id').iterator(chunk_size=1000)
+    batch = []
+    for notification_id, actor_id in rows:
+        batch.append(NotificationActor(notification_id=notification_id, actor_id=actor_id))
+        if len(batch) >= 1000:
+            NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('work13', '0012_followsuggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='実行者')),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actor_links', to='work13.notification', verbose_name='通知')),
+            ],
+            options={
+                'verbose_name': '通知の実行者',
+                'verbose_name_plural': '通知の実行者',
+                'unique_together': {('notification', 'actor')},
+            },
+        ),
+        migrations.RunPython(add_latest_actors, migrations.RunPython.noop),
+    ]
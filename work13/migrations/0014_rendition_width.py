@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work13', '0013_notificationactor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_rendition_width',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='レンディションの最大幅'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_rendition_width',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='レンディションの最大幅'),
+        ),
+    ]
@@ -1,7 +1,19 @@
 from django.db import models
 from django.contrib.auth.models import User
-from PIL import Image
-import os
+from .image_worker import IMAGE_READY, IMAGE_PENDING, IMAGE_STATUS_CHOICES, ImageSpec, enqueue
+
+# 元画像の最大サイズと、配信用レンディションの幅（px）
+AVATAR_SPEC = ImageSpec('avatar', 'avatar_status', 'avatar_rendition', 'avatar_rendition_width', 300, (40, 80, 150, 300))
+POST_IMAGE_SPEC = ImageSpec('image', 'image_status', 'image_rendition', 'image_rendition_width', 800, (320, 480, 640, 800))
+
+
+def _protect_counters(instance, kwargs):
+    """既存レコードの保存でカウンター列を古い値で上書きしないようにする"""
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            f.name for f in instance._meta.concrete_fields
+            if not f.primary_key and f.name not in instance.COUNTER_FIELDS
+        ]
 
 
 class UserProfile(models.Model):
@@ -9,20 +21,34 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="ユーザー")
     bio = models.TextField(max_length=500, blank=True, verbose_name="自己紹介")
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True, verbose_name="プロフィール画像")
+    avatar_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY, editable=False, verbose_name="画像処理状態")
+    avatar_rendition = models.CharField(max_length=40, blank=True, editable=False, verbose_name="レンディション")
+    avatar_rendition_width = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, verbose_name="レンディションの最大幅")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日")
+    # 非正規化カウンター（Post/Follow の増減時に F() で更新）
+    post_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="投稿数")
+    follower_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="フォロワー数")
+    following_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="フォロー数")
+    # 未読通知数（バッジ表示用に Notification を数えずに済ませる）
+    unread_notification_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="未読通知数")
+
+    COUNTER_FIELDS = ('post_count', 'follower_count', 'following_count', 'unread_notification_count')
+    IMAGE_SPECS = {'avatar': AVATAR_SPEC}
     
     def __str__(self):
         return f"{self.user.username}のプロフィール"
     
     def save(self, *args, **kwargs):
+        # 新しくアップロードされた場合だけ、保存後にワーカーでリサイズする
+        avatar_changed = bool(self.avatar) and not self.avatar._committed
+        if avatar_changed:
+            self.avatar_status = IMAGE_PENDING
+            self.avatar_rendition = ''
+            self.avatar_rendition_width = None
+        _protect_counters(self, kwargs)
         super().save(*args, **kwargs)
-        if self.avatar:
-            # プロフィール画像をリサイズ
-            img = Image.open(self.avatar.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size)
-                img.save(self.avatar.path)
+        if avatar_changed:
+            enqueue(self, AVATAR_SPEC)
     
     class Meta:
         verbose_name = "ユーザープロフィール"
@@ -33,30 +59,47 @@ class Post(models.Model):
     """投稿モデル"""
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="投稿者")
     image = models.ImageField(upload_to='posts/', verbose_name="画像")
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY, editable=False, verbose_name="画像処理状態")
+    image_rendition = models.CharField(max_length=40, blank=True, editable=False, verbose_name="レンディション")
+    image_rendition_width = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, verbose_name="レンディションの最大幅")
     caption = models.TextField(max_length=2000, blank=True, verbose_name="キャプション")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="投稿日時")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+    # 非正規化カウンター（Like/Comment の増減時に F() で更新）
+    like_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="いいね数")
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="コメント数")
+    # 時間減衰させたいいね・コメントの合計（update_trending_scores コマンドで更新）
+    trending_score = models.FloatField(default=0, editable=False, verbose_name="トレンドスコア")
+
+    COUNTER_FIELDS = ('like_count', 'comment_count', 'trending_score')
+    IMAGE_SPECS = {'image': POST_IMAGE_SPEC}
     
     def __str__(self):
         return f"{self.author.username}の投稿 - {self.created_at.strftime('%Y/%m/%d %H:%M')}"
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 検索インデックスの作り直しが必要か判断するため、読み込んだ時点の値を控える
+        instance._indexed_search_values = instance._search_values()
+        return instance
+
+    def _search_values(self):
+        """検索インデックスに使う値（遅延読み込みの列は None）"""
+        loaded = self.__dict__
+        return loaded.get('caption'), loaded.get('author_id')
+
     def save(self, *args, **kwargs):
+        # 新しくアップロードされた場合だけ、保存後にワーカーでリサイズする
+        image_changed = bool(self.image) and not self.image._committed
+        if image_changed:
+            self.image_status = IMAGE_PENDING
+            self.image_rendition = ''
+            self.image_rendition_width = None
+        _protect_counters(self, kwargs)
         super().save(*args, **kwargs)
-        if self.image:
-            # 投稿画像をリサイズ
-            img = Image.open(self.image.path)
-            if img.height > 800 or img.width > 800:
-                output_size = (800, 800)
-                img.thumbnail(output_size)
-                img.save(self.image.path)
-    
-    def like_count(self):
-        """いいね数を取得"""
-        return self.likes.count()
-    
-    def comment_count(self):
-        """コメント数を取得"""
-        return self.comments.count()
+        if image_changed:
+            enqueue(self, POST_IMAGE_SPEC)
     
     def is_liked_by(self, user):
         """特定のユーザーがいいねしているかチェック"""
@@ -68,6 +111,12 @@ class Post(models.Model):
         verbose_name = "投稿"
         verbose_name_plural = "投稿"
         ordering = ['-created_at']
+        indexes = [
+            # カーソルページネーション用 (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='work13_post_created'),
+            models.Index(fields=['author', '-created_at', '-id'], name='work13_post_author_created'),
+            models.Index(fields=['-trending_score', '-id'], name='work13_post_trending'),
+        ]
 
 
 class Like(models.Model):
@@ -78,6 +127,13 @@ class Like(models.Model):
     
     def __str__(self):
         return f"{self.user.username} → {self.post.author.username}の投稿"
+
+    def delete(self, *args, **kwargs):
+        # 1件ずつの削除でだけいいね数を減らす。post_delete シグナルを使うと
+        # 投稿の削除に伴うカスケードが一括 DELETE にならず、全件を読み込むことになる
+        result = super().delete(*args, **kwargs)
+        _bump_post_counter(self.post_id, 'like_count', -1)
+        return result
     
     class Meta:
         verbose_name = "いいね"
@@ -96,11 +152,21 @@ class Comment(models.Model):
     
     def __str__(self):
         return f"{self.user.username}: {self.content[:30]}..."
+
+    def delete(self, *args, **kwargs):
+        # Like.delete と同じく、1件ずつの削除でだけコメント数を減らす
+        result = super().delete(*args, **kwargs)
+        _bump_post_counter(self.post_id, 'comment_count', -1)
+        return result
     
     class Meta:
         verbose_name = "コメント"
         verbose_name_plural = "コメント"
         ordering = ['created_at']
+        indexes = [
+            # 投稿ごとの新しい順カーソル読み込み用
+            models.Index(fields=['post', '-created_at', '-id'], name='work13_comment_post_created'),
+        ]
 
 
 class Follow(models.Model):
@@ -119,6 +185,135 @@ class Follow(models.Model):
         ordering = ['-created_at']
 
 
+class TimelineEntry(models.Model):
+    """ホームタイムライン（書き込み時にフォロワーへ配信される投稿の受信箱）"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries', verbose_name="受信ユーザー")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries', verbose_name="投稿")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="投稿者")
+    created_at = models.DateTimeField(verbose_name="投稿日時")
+
+    def __str__(self):
+        return f"{self.user.username}のタイムライン ← {self.post_id}"
+
+    class Meta:
+        verbose_name = "タイムライン"
+        verbose_name_plural = "タイムライン"
+        unique_together = ('user', 'post')
+        ordering = ['-created_at', '-post_id']
+        indexes = [
+            # ホーム表示は (user, created_at) の範囲読み込みだけで済ませる
+            models.Index(fields=['user', '-created_at', '-post'], name='work13_timeline_user_created'),
+            # フォロー解除時の削除用
+            models.Index(fields=['user', 'author'], name='work13_timeline_user_author'),
+        ]
+
+
+class SearchTerm(models.Model):
+    """検索用転置インデックス（文字 bigram / 1文字の unigram）"""
+    FIELD_CAPTION = 'c'
+    FIELD_USERNAME = 'u'
+    FIELD_CHOICES = [
+        (FIELD_CAPTION, 'キャプション'),
+        (FIELD_USERNAME, 'ユーザー名'),
+    ]
+
+    term = models.CharField(max_length=2, verbose_name="語")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_terms', verbose_name="投稿")
+    field = models.CharField(max_length=1, choices=FIELD_CHOICES, verbose_name="対象")
+    weight = models.PositiveSmallIntegerField(default=1, verbose_name="出現回数")
+
+    def __str__(self):
+        return f"{self.term} → {self.post_id} ({self.field})"
+
+    class Meta:
+        verbose_name = "検索インデックス"
+        verbose_name_plural = "検索インデックス"
+        unique_together = ('term', 'post', 'field')
+
+
+class Notification(models.Model):
+    """通知モデル（同じ投稿への未読のいいね・コメントは1件にまとめる）"""
+    LIKE = 'like'
+    COMMENT = 'comment'
+    FOLLOW = 'follow'
+    VERB_CHOICES = [
+        (LIKE, 'いいね'),
+        (COMMENT, 'コメント'),
+        (FOLLOW, 'フォロー'),
+    ]
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications', verbose_name="通知先")
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="最新の実行者")
+    verb = models.CharField(max_length=10, choices=VERB_CHOICES, verbose_name="種類")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name="投稿")
+    actor_count = models.PositiveIntegerField(default=1, verbose_name="実行者数")
+    is_read = models.BooleanField(default=False, verbose_name="既読")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    def __str__(self):
+        return f"{self.recipient.username}: {self.message}"
+
+    @property
+    def message(self):
+        """「Aさんと他12人があなたの投稿にいいねしました」形式の文言"""
+        who = f"{self.actor.username}さん"
+        if self.actor_count > 1:
+            who += f"と他{self.actor_count - 1}人"
+        if self.verb == self.LIKE:
+            return f"{who}があなたの投稿にいいねしました"
+        if self.verb == self.COMMENT:
+            return f"{who}があなたの投稿にコメントしました"
+        return f"{who}があなたをフォローしました"
+
+    class Meta:
+        verbose_name = "通知"
+        verbose_name_plural = "通知"
+        ordering = ['-updated_at']
+        indexes = [
+            # 未読通知のまとめ先検索用
+            models.Index(fields=['recipient', 'is_read', 'verb', 'post'], name='work13_notif_collapse'),
+            # 通知一覧用
+            models.Index(fields=['recipient', '-updated_at'], name='work13_notif_recipient'),
+        ]
+
+
+class NotificationActor(models.Model):
+    """まとめた通知に数えた実行者（同じ人を2回数えないため）"""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actor_links', verbose_name="通知")
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="実行者")
+
+    def __str__(self):
+        return f"{self.notification_id}: {self.actor_id}"
+
+    class Meta:
+        verbose_name = "通知の実行者"
+        verbose_name_plural = "通知の実行者"
+        unique_together = ('notification', 'actor')
+
+
+class FollowSuggestion(models.Model):
+    """おすすめユーザー（build_follow_suggestions コマンドで一括計算）"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions', verbose_name="ユーザー")
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="おすすめユーザー")
+    score = models.FloatField(verbose_name="スコア")
+    mutual_count = models.PositiveIntegerField(default=0, verbose_name="共通のフォロー数")
+    co_like_count = models.PositiveIntegerField(default=0, verbose_name="共通のいいね数")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="計算日時")
+
+    def __str__(self):
+        return f"{self.user.username} へのおすすめ: {self.suggested.username}"
+
+    class Meta:
+        verbose_name = "おすすめユーザー"
+        verbose_name_plural = "おすすめユーザー"
+        unique_together = ('user', 'suggested')
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['user', '-score'], name='work13_suggestion_user'),
+        ]
+
+
 # シグナルを使ってUserが作成されたときに自動的にUserProfileを作成
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -131,3 +326,139 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.userprofile.save()
+
+
+# タイムラインへの配信（fan-out on write）
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, pre_delete
+
+from .feed_cache import bump_post_versions
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        from .timeline import fan_out_post
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline_on_follow(sender, instance, created, **kwargs):
+    if created:
+        from .timeline import backfill_follow
+        backfill_follow(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline_on_unfollow(sender, instance, **kwargs):
+    from .timeline import prune_follow
+    prune_follow(instance.follower_id, instance.following_id)
+
+
+@receiver(post_save, sender=Follow)
+def drop_followed_suggestion(sender, instance, created, **kwargs):
+    # フォロー済みのユーザーは次の一括計算を待たずにおすすめから外す
+    if created:
+        FollowSuggestion.objects.filter(
+            user_id=instance.follower_id, suggested_id=instance.following_id
+        ).delete()
+
+
+# いいね・コメント数、投稿・フォロー数カウンターの更新
+def _bump_counter(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def _bump_post_counter(post_id, field, delta):
+    _bump_counter(Post.objects.filter(pk=post_id), field, delta)
+    # ホームのキャッシュに載っている件数を確定後に無効化
+    transaction.on_commit(partial(bump_post_versions, [post_id]))
+
+
+def _bump_profile_counter(user_id, field, delta):
+    _bump_counter(UserProfile.objects.filter(user_id=user_id), field, delta)
+
+
+@receiver(post_save, sender=Like)
+def increment_like_count(sender, instance, created, **kwargs):
+    if created:
+        _bump_post_counter(instance.post_id, 'like_count', 1)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created:
+        _bump_post_counter(instance.post_id, 'comment_count', 1)
+
+
+# いいね・コメントの削除は Like.delete / Comment.delete で減らす（一括削除は対象外）
+@receiver(pre_delete, sender=User)
+def decrement_counters_for_deleted_user(sender, instance, **kwargs):
+    # ユーザーの削除で一緒に消えるいいね・コメントの分を、他のユーザーの投稿ごとにまとめて減らす
+    for model, field in ((Like, 'like_count'), (Comment, 'comment_count')):
+        counts = (
+            model.objects.filter(user=instance)
+            .exclude(post__author=instance)
+            .order_by()
+            .values('post_id')
+            .annotate(total=Count('id'))
+        )
+        for row in counts:
+            _bump_post_counter(row['post_id'], field, -row['total'])
+
+
+@receiver(post_save, sender=Post)
+def increment_post_count(sender, instance, created, **kwargs):
+    if created:
+        _bump_profile_counter(instance.author_id, 'post_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def decrement_post_count(sender, instance, **kwargs):
+    _bump_profile_counter(instance.author_id, 'post_count', -1)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    # 削除した投稿を表示しているホームのキャッシュを無効化
+    transaction.on_commit(partial(bump_post_versions, [instance.id]))
+
+
+@receiver(post_save, sender=Follow)
+def increment_follow_counts(sender, instance, created, **kwargs):
+    if created:
+        _bump_profile_counter(instance.follower_id, 'following_count', 1)
+        _bump_profile_counter(instance.following_id, 'follower_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_follow_counts(sender, instance, **kwargs):
+    _bump_profile_counter(instance.follower_id, 'following_count', -1)
+    _bump_profile_counter(instance.following_id, 'follower_count', -1)
+
+
+# 検索インデックスの差分更新
+@receiver(post_save, sender=Post)
+def index_post_for_search(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'caption' not in update_fields and 'author' not in update_fields:
+        return
+    # キャプションも投稿者も変わっていない保存（カウンター以外の列の更新など）は作り直さない
+    indexed = getattr(instance, '_indexed_search_values', None)
+    if not created and indexed is not None and None not in indexed and indexed == instance._search_values():
+        return
+    from .search import index_post
+    index_post(instance)
+    instance._indexed_search_values = instance._search_values()
+
+
+@receiver(post_save, sender=User)
+def reindex_username_for_search(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    from .search import reindex_author
+    reindex_author(instance)
@@ -0,0 +1,165 @@
+"""いいね・コメント・フォローの通知
+
+通知は Notification に保存し（オフラインのユーザーにも残る）、
+トランザクション確定後に NotificationConsumer の user_<id>_notifications グループへ送る。
+
+同じ投稿への未読のいいね・コメント（フォローは通知先ごと）は1件にまとめ、
+「Aさんと他12人があなたの投稿にいいねしました」と表示する。
+人数は NotificationActor に記録した別人の数で、同じ人の2回目以降は数えない。
+新規分は bulk_create でまとめて作成し、未読数は UserProfile の
+カウンターを F() で増減するので、バッジ表示のたびに COUNT は発生しない。
+"""
+
+from collections import Counter
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from python_apps_django.websocket import group_event
+
+from .models import Notification, NotificationActor, UserProfile
+from .realtime import _group_send
+
+
+def notification_group_name(user_id):
+    return f"user_{user_id}_notifications"
+
+
+def _deliver(payloads):
+    for recipient_id, event in payloads:
+        _group_send(notification_group_name(recipient_id), event)
+
+
+def _event(notification, collapsed):
+    return group_event(
+        "notification_message",
+        {
+            "type": "notification",
+            "notification_type": notification.verb,
+            "message": notification.message,
+            "from_user": notification.actor.username,
+            "post_id": notification.post_id,
+            # まとめられた通知は未読数を増やさない
+            "collapsed": collapsed,
+        },
+    )
+
+
+def _assign_created_pks(created):
+    """bulk_create で主キーが返らない DB（MySQL）では、作成した通知の主キーを読み直す"""
+    missing = [n for n in created.values() if n.pk is None]
+    if not missing:
+        return
+    keys = Q()
+    for n in missing:
+        keys |= Q(recipient_id=n.recipient_id, verb=n.verb, post_id=n.post_id)
+    rows = (
+        Notification.objects.filter(keys, is_read=False)
+        .order_by("id")
+        .values_list("id", "recipient_id", "verb", "post_id")
+    )
+    for pk, recipient_id, verb, post_id in rows:
+        notification = created.get((recipient_id, verb, post_id))
+        if notification is not None:
+            notification.pk = pk
+
+
+def notify_bulk(events):
+    """通知をまとめて作成する
+
+    events は (通知先ユーザーID, 実行者 User, 種類, 投稿ID または None) のリスト。
+    自分自身への通知は作らない。
+    """
+    events = [event for event in events if event[0] != event[1].id]
+    if not events:
+        return
+
+    with transaction.atomic():
+        # 未読のまとめ先を一度に取得
+        keys = Q()
+        for recipient_id, _, verb, post_id in events:
+            keys |= Q(recipient_id=recipient_id, verb=verb, post_id=post_id)
+        existing = {
+            (n.recipient_id, n.verb, n.post_id): n
+            for n in Notification.objects.filter(keys, is_read=False)
+            .select_related("actor")
+            .select_for_update()
+        }
+        # まとめ先ですでに数えた実行者（今回の実行者の分だけ読む）
+        counted = set()
+        if existing:
+            counted = {
+                (notification_id, actor_id)
+                for notification_id, actor_id in NotificationActor.objects.filter(
+                    notification__in=existing.values(),
+                    actor_id__in={actor.id for _, actor, _, _ in events},
+                ).values_list("notification_id", "actor_id")
+            }
+
+        now = timezone.now()
+        created = {}
+        created_actors = {}
+        new_links = []
+        payloads = []
+        for recipient_id, actor, verb, post_id in events:
+            key = (recipient_id, verb, post_id)
+            notification = existing.get(key)
+            if notification is None:
+                if key in created:
+                    created_actors[key].append(actor)
+                else:
+                    created[key] = Notification(
+                        recipient_id=recipient_id, actor=actor, verb=verb, post_id=post_id
+                    )
+                    created_actors[key] = [actor]
+                continue
+            if (notification.pk, actor.id) in counted:
+                # 数え済みの人の繰り返し（いいねの付け外しなど）は数えない
+                continue
+            counted.add((notification.pk, actor.id))
+            new_links.append(NotificationActor(notification=notification, actor=actor))
+            notification.actor = actor
+            notification.actor_count += 1
+            Notification.objects.filter(pk=notification.pk).update(
+                actor=actor, actor_count=F("actor_count") + 1, updated_at=now
+            )
+            payloads.append((recipient_id, _event(notification, collapsed=True)))
+
+        if created:
+            # 同じバッチ内の複数の実行者は、別人だけを数えて最後の人を表示する
+            for key, notification in created.items():
+                distinct = list({actor.id: actor for actor in created_actors[key]}.values())
+                notification.actor = created_actors[key][-1]
+                notification.actor_count = len(distinct)
+                created_actors[key] = distinct
+            Notification.objects.bulk_create(created.values())
+            _assign_created_pks(created)
+            new_links.extend(
+                NotificationActor(notification=created[key], actor=actor)
+                for key, actors in created_actors.items()
+                for actor in actors
+            )
+            unread = Counter(recipient_id for recipient_id, _, _ in created)
+            for recipient_id, count in unread.items():
+                UserProfile.objects.filter(user_id=recipient_id).update(
+                    unread_notification_count=F("unread_notification_count") + count
+                )
+            payloads.extend(
+                (n.recipient_id, _event(n, collapsed=False)) for n in created.values()
+            )
+
+        NotificationActor.objects.bulk_create(new_links, ignore_conflicts=True)
+        transaction.on_commit(partial(_deliver, payloads))
+
+
+def notify(recipient_id, actor, verb, post_id=None):
+    notify_bulk([(recipient_id, actor, verb, post_id)])
+
+
+def mark_all_read(user):
+    """未読通知をすべて既読にする"""
+    with transaction.atomic():
+        Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+        UserProfile.objects.filter(user=user).update(unread_notification_count=0)
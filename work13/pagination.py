@@ -0,0 +1,153 @@
+"""キーセット（カーソル）ページネーション
+
+Paginator は件数取得の COUNT(*) と OFFSET を伴うため、後ろのページほど遅くなる。
+ここでは (created_at, id) の組をカーソルにして「その位置より前/後」を
+インデックスの範囲読み込みで取得し、件数は一切数えない。
+並び順のキーには日時のほか数値（trending_score など）も使える。
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import DateTimeField, Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key, pk, direction):
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    payload = json.dumps([key, pk, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, key_type=datetime):
+    """カーソルを (キー, 主キー, 方向) に戻す
+
+    key_type（datetime または float）と合わないキーは InvalidCursor にする。
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, pk, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if key_type is datetime:
+            key = parse_datetime(key) if isinstance(key, str) else None
+        elif isinstance(key, bool) or not isinstance(key, (int, float)):
+            key = None
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if key is None or not isinstance(pk, int) or direction not in ("n", "p"):
+        raise InvalidCursor(cursor)
+    return key, pk, direction
+
+
+class CursorPage:
+    """1ページ分の結果と前後のカーソル"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """新しい順の (created_at, id) キーセットページネーター
+
+    ``fields`` にはクエリセット上の並び順のフィールド（日時または数値）と
+    整数の主キー相当のフィールドを渡す。annotate した値も指定できる。
+    いずれも降順で並べる。
+    """
+
+    def __init__(self, queryset, per_page, fields=("created_at", "id")):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key_field, self.pk_field = fields
+
+    @property
+    def key_type(self):
+        """並び順のフィールドが日時なら datetime、それ以外（数値）なら float"""
+        annotation = self.queryset.query.annotations.get(self.key_field)
+        if annotation is not None:
+            field = annotation.output_field
+        else:
+            try:
+                field = self.queryset.model._meta.get_field(self.key_field)
+            except FieldDoesNotExist:
+                return datetime
+        return datetime if isinstance(field, DateTimeField) else float
+
+    def _after(self, key, pk):
+        # 指定位置より後ろ（古い・低いもの）
+        return Q(**{f"{self.key_field}__lt": key}) | Q(
+            **{self.key_field: key, f"{self.pk_field}__lt": pk}
+        )
+
+    def _before(self, key, pk):
+        # 指定位置より前（新しい・高いもの）
+        return Q(**{f"{self.key_field}__gt": key}) | Q(
+            **{self.key_field: key, f"{self.pk_field}__gt": pk}
+        )
+
+    def _key(self, obj):
+        return getattr(obj, self.key_field), getattr(obj, self.pk_field)
+
+    def get_page(self, cursor=None):
+        """カーソル文字列からページを取得（不正なカーソルは先頭ページ扱い）"""
+        position = None
+        if cursor:
+            try:
+                position = decode_cursor(cursor, self.key_type)
+            except InvalidCursor:
+                position = None
+
+        limit = self.per_page + 1
+        if position is None:
+            rows = list(
+                self.queryset.order_by(f"-{self.key_field}", f"-{self.pk_field}")[:limit]
+            )
+            has_more, has_less = len(rows) > self.per_page, False
+        elif position[2] == "n":
+            rows = list(
+                self.queryset.filter(self._after(*position[:2])).order_by(
+                    f"-{self.key_field}", f"-{self.pk_field}"
+                )[:limit]
+            )
+            has_more, has_less = len(rows) > self.per_page, True
+        else:
+            rows = list(
+                self.queryset.filter(self._before(*position[:2])).order_by(
+                    self.key_field, self.pk_field
+                )[:limit]
+            )
+            has_more, has_less = True, len(rows) > self.per_page
+            rows = rows[: self.per_page][::-1]
+
+        rows = rows[: self.per_page]
+        next_cursor = previous_cursor = None
+        if rows and has_more:
+            next_cursor = encode_cursor(*self._key(rows[-1]), "n")
+        if rows and has_less:
+            previous_cursor = encode_cursor(*self._key(rows[0]), "p")
+        return CursorPage(rows, next_cursor, previous_cursor)
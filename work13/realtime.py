@@ -0,0 +1,181 @@
+"""サーバー側から PostConsumer / LiveFeedConsumer へリアルタイム更新を送る
+
+いいね・コメントはビュー（toggle_like / add_comment）のトランザクション確定後に
+サーバーから post_<id> グループへ送信する。ブラウザからの通知には頼らない。
+
+いいね数は投稿ごとに短い時間窓でまとめ、窓の終わりに最新の値だけを送る。
+500件のいいねが集中しても数フレームで済み、件数は非正規化カウンターを
+窓ごとに1回のクエリでまとめて読むので COUNT は発生しない。
+
+新しい投稿の通知は全接続へのブロードキャストではなく、
+投稿者本人とフォロワーそれぞれの feed_user_<id> グループにだけ送る。
+group_send はまとめて並行に発行するので、1投稿あたりのコストは
+接続総数ではなくフォロワー数に比例する。
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import close_old_connections
+
+from python_apps_django.websocket import group_event
+
+logger = logging.getLogger(__name__)
+
+# いいね数をまとめる時間窓（秒）
+LIKE_COALESCE_WINDOW = 0.25
+
+# 新着投稿の通知で一度に並行発行する group_send の数
+FAN_OUT_BATCH_SIZE = 200
+
+
+def post_group_name(post_id):
+    return f"post_{post_id}"
+
+
+def feed_group_name(user_id):
+    return f"feed_user_{user_id}"
+
+
+def _group_send(group, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(group, event)
+
+
+class LikeCountCoalescer:
+    """投稿ごとのいいね数更新を時間窓でまとめて送信する"""
+
+    def __init__(self, window=LIKE_COALESCE_WINDOW):
+        self.window = window
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def publish(self, post_id):
+        """いいね数が変わった投稿を記録し、窓の終わりの送信を予約する"""
+        with self._lock:
+            self._dirty.add(post_id)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            post_ids, self._dirty = self._dirty, set()
+            self._timer = None
+        if not post_ids:
+            return
+
+        from .models import Post
+
+        try:
+            # 窓内の全投稿の最新カウンターを1回で読む
+            counts = Post.objects.filter(id__in=post_ids).values_list("id", "like_count")
+            for post_id, like_count in counts:
+                _group_send(
+                    post_group_name(post_id),
+                    group_event(
+                        "like_count_update",
+                        {
+                            "type": "like_update",
+                            "post_id": post_id,
+                            "like_count": like_count,
+                            "user_id": None,
+                        },
+                    ),
+                )
+        except Exception:
+            logger.exception("いいね数の送信に失敗しました: %s", sorted(post_ids))
+        finally:
+            close_old_connections()
+
+
+like_count_coalescer = LikeCountCoalescer()
+
+
+def publish_like(post_id):
+    like_count_coalescer.publish(post_id)
+
+
+def publish_comment(comment):
+    """新しいコメントをすぐに送信する"""
+    try:
+        _group_send(
+            post_group_name(comment.post_id),
+            group_event(
+                "comment_notification",
+                {
+                    "type": "new_comment",
+                    "post_id": comment.post_id,
+                    "comment_id": comment.id,
+                    "author": comment.user.username,
+                    "content": comment.content,
+                    "created_at": comment.created_at.strftime("%Y/%m/%d %H:%M"),
+                },
+            ),
+        )
+    except Exception:
+        logger.exception("コメントの送信に失敗しました: %s", comment.id)
+
+
+async def _send_batched(channel_layer, groups, event):
+    for i in range(0, len(groups), FAN_OUT_BATCH_SIZE):
+        await asyncio.gather(
+            *(
+                channel_layer.group_send(group, event)
+                for group in groups[i : i + FAN_OUT_BATCH_SIZE]
+            )
+        )
+
+
+def _fan_out_new_post(post_id, author_id, author_username):
+    from .models import Follow
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    # 全フォロワー分のグループに同じエンコード済みのイベントを送る
+    event = group_event(
+        "new_post_notification",
+        {
+            "type": "new_post",
+            "post_id": post_id,
+            "author": author_username,
+            "message": "新しい投稿があります！",
+        },
+    )
+    try:
+        send = async_to_sync(_send_batched)
+        groups = [feed_group_name(author_id)]
+        follower_ids = Follow.objects.filter(following_id=author_id).values_list(
+            "follower_id", flat=True
+        )
+        for follower_id in follower_ids.iterator(chunk_size=FAN_OUT_BATCH_SIZE):
+            groups.append(feed_group_name(follower_id))
+            if len(groups) >= FAN_OUT_BATCH_SIZE:
+                send(channel_layer, groups, event)
+                groups = []
+        if groups:
+            send(channel_layer, groups, event)
+    except Exception:
+        logger.exception("新着投稿の通知に失敗しました: %s", post_id)
+    finally:
+        close_old_connections()
+
+
+# フォロワーへの配信はリクエストを待たせないよう別スレッドで行う
+_fan_out_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="work13-feed")
+
+
+def publish_new_post(post):
+    """新しい投稿を投稿者本人とフォロワーのライブフィードに通知する"""
+    _fan_out_executor.submit(
+        _fan_out_new_post, post.id, post.author_id, post.author.username
+    )
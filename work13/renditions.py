@@ -0,0 +1,100 @@
+"""レスポンシブ画像用の複数サイズ・WebP レンディション
+
+元画像の内容ハッシュをファイル名に含めて
+``renditions/<ハッシュ先頭2文字>/<ハッシュ>-<幅>.<拡張子>`` に保存する。
+内容が変わればファイル名も変わるので、URL は永続的にキャッシュできる
+（views.rendition が Cache-Control: immutable 付きで配信する）。
+生成はワーカープロセス（image_worker）で行い、
+モデルには ``<ハッシュ>.<拡張子>`` 形式のキーと、生成した最大の幅を保存する。
+
+元画像より大きい幅は作らず、代わりに元画像の幅のものを作る。
+srcset には実際に生成した幅だけを載せる。
+"""
+
+import hashlib
+import io
+import os
+
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+RENDITION_DIR = "renditions"
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# 配信時の形式ごとの Content-Type
+CONTENT_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+# ファイル名が内容ごとに変わるので、ブラウザ・CDN に再検証させない
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def rendition_name(key, width, ext=None):
+    """レンディションのストレージ上の名前（ext 省略時は元の形式）"""
+    digest, _, original_ext = key.partition(".")
+    return f"{RENDITION_DIR}/{digest[:2]}/{digest}-{width}.{ext or original_ext}"
+
+
+def rendition_url(key, width, ext=None):
+    name = rendition_name(key, width, ext)
+    return reverse("work13:rendition", args=[name[len(RENDITION_DIR) + 1:]])
+
+
+def rendition_widths(widths, max_width=None):
+    """生成済みの幅（max_width の記録がない以前の画像は widths をすべて生成済み）"""
+    if not max_width:
+        return tuple(widths)
+    return tuple(width for width in widths if width < max_width) + (max_width,)
+
+
+def closest_width(widths, max_width, target):
+    """生成済みの幅のうち target 以上で最小のもの（なければ最大のもの）"""
+    available = rendition_widths(widths, max_width)
+    return next((width for width in available if width >= target), available[-1])
+
+
+def srcset(key, widths, ext=None):
+    return ", ".join(f"{rendition_url(key, width, ext)} {width}w" for width in widths)
+
+
+def build_renditions(source_path, widths, media_root):
+    """元画像から各幅の元形式・WebP 版を生成し、キーと最大の幅を返す（ワーカープロセスで実行）"""
+    with open(source_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ("RGBA", "LA", "P")
+        ext = "png" if has_alpha else "jpg"
+        key = f"{digest}.{ext}"
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        max_width = min(img.width, widths[-1])
+
+        for width in rendition_widths(widths, max_width):
+            targets = [
+                (rendition_name(key, width), "PNG" if has_alpha else "JPEG"),
+                (rendition_name(key, width, "webp"), "WEBP"),
+            ]
+            pending = [
+                (name, fmt)
+                for name, fmt in targets
+                if not os.path.exists(os.path.join(media_root, name))
+            ]
+            if not pending:
+                # 同じ内容の画像は生成済み
+                continue
+
+            resized = img.copy()
+            if resized.width > width:
+                resized.thumbnail((width, round(img.height * width / img.width) or 1))
+            for name, fmt in pending:
+                path = os.path.join(media_root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                options = {"quality": WEBP_QUALITY if fmt == "WEBP" else JPEG_QUALITY}
+                if fmt == "PNG":
+                    options = {"optimize": True}
+                # 書きかけのファイルを配信しないよう一時ファイル経由で置き換える
+                tmp_path = f"{path}.tmp"
+                resized.save(tmp_path, format=fmt, **options)
+                os.replace(tmp_path, path)
+    return key, max_width
@@ -0,0 +1,171 @@
+"""キャプション・ユーザー名の全文検索（文字 bigram 転置インデックス）
+
+``caption__icontains`` は前方ワイルドカードの LIKE になりインデックスが使えず、
+検索のたびに Post 全体を走査する。ここでは NFKC 正規化した文字列を
+文字 bigram（1文字の語は unigram）に分解して SearchTerm に保存しておき、
+検索語の bigram をすべて含む投稿をインデックスだけで求める。
+分かち書きのない日本語でも部分一致で検索できる。
+スコアの集計・並べ替え・件数の制限は SQL で行い、表示するページまでの件数だけを受け取る。
+"""
+
+import base64
+import json
+import unicodedata
+from collections import Counter
+
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+
+from .models import Post, SearchTerm
+from .pagination import CursorPage
+
+# ユーザー名一致はキャプション一致より上位に表示する
+USERNAME_BOOST = 3
+
+# 1回の検索でランキングする件数の上限
+MAX_HITS = 1000
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def _grams(word):
+    if len(word) == 1:
+        return [word]
+    return [word[i : i + 2] for i in range(len(word) - 1)]
+
+
+def tokenize(text):
+    """文字列を索引語（unigram と bigram）の出現回数に分解
+
+    unigram も入れておくことで1文字だけの検索語にも対応する。
+    """
+    terms = Counter()
+    for word in normalize(text).split():
+        terms.update(word)
+        if len(word) > 1:
+            terms.update(_grams(word))
+    return terms
+
+
+def query_terms(query):
+    """検索語を bigram に分解（1文字だけの語は unigram で引く）"""
+    terms = set()
+    for word in normalize(query).split():
+        terms.update(_grams(word))
+    return terms
+
+
+def _terms_for(post_id, field, text):
+    return [
+        SearchTerm(post_id=post_id, field=field, term=term, weight=min(count, 32767))
+        for term, count in tokenize(text).items()
+    ]
+
+
+def index_post(post, username=None):
+    """1投稿分のインデックスを作り直す"""
+    if username is None:
+        username = post.author.username
+    SearchTerm.objects.filter(post_id=post.id).delete()
+    SearchTerm.objects.bulk_create(
+        _terms_for(post.id, SearchTerm.FIELD_CAPTION, post.caption)
+        + _terms_for(post.id, SearchTerm.FIELD_USERNAME, username),
+        ignore_conflicts=True,
+    )
+
+
+def reindex_author(user):
+    """ユーザー名が変わった場合に、そのユーザーの投稿のユーザー名部分を作り直す"""
+    latest = Post.objects.filter(author=user).only("id").first()
+    if latest is None:
+        return
+    expected = {
+        term.term
+        for term in _terms_for(latest.id, SearchTerm.FIELD_USERNAME, user.username)
+    }
+    stored = set(
+        SearchTerm.objects.filter(
+            post_id=latest.id, field=SearchTerm.FIELD_USERNAME
+        ).values_list("term", flat=True)
+    )
+    if expected == stored:
+        return
+
+    SearchTerm.objects.filter(
+        post__author=user, field=SearchTerm.FIELD_USERNAME
+    ).delete()
+    for post_id in Post.objects.filter(author=user).values_list("id", flat=True):
+        SearchTerm.objects.bulk_create(
+            _terms_for(post_id, SearchTerm.FIELD_USERNAME, user.username),
+            ignore_conflicts=True,
+        )
+
+
+def search_post_ids(query, limit=MAX_HITS):
+    """検索語に一致する投稿IDをスコア順に最大 limit 件返す"""
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    caption = Q(field=SearchTerm.FIELD_CAPTION)
+    username = Q(field=SearchTerm.FIELD_USERNAME)
+    # 対象ごとに、検索語の bigram をすべて含む場合だけスコアに加える
+    rows = (
+        SearchTerm.objects.filter(term__in=terms)
+        .values("post_id")
+        .annotate(
+            caption_matched=Count("term", filter=caption),
+            username_matched=Count("term", filter=username),
+            caption_score=Sum("weight", filter=caption),
+            username_score=Sum("weight", filter=username),
+        )
+        .filter(Q(caption_matched=len(terms)) | Q(username_matched=len(terms)))
+        .annotate(
+            rank=Case(
+                When(caption_matched=len(terms), then=F("caption_score")),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            + Case(
+                When(username_matched=len(terms), then=F("username_score") * USERNAME_BOOST),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        .order_by("-rank", "-post_id")
+        .values_list("post_id", flat=True)
+    )
+    return list(rows[: min(limit, MAX_HITS)])
+
+
+def _encode_offset(offset):
+    return base64.urlsafe_b64encode(json.dumps(["s", offset]).encode()).decode().rstrip("=")
+
+
+def _decode_offset(cursor):
+    try:
+        tag, offset = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return 0
+    if tag != "s" or not isinstance(offset, int) or offset < 0:
+        return 0
+    return offset
+
+
+def search_page(query, per_page, cursor=None):
+    """検索結果の1ページ分を Post のリストとして返す"""
+    offset = _decode_offset(cursor) if cursor else 0
+    # 次のページがあるか分かるよう、このページの1件先まで取得する
+    hit_ids = search_post_ids(query, offset + per_page + 1)
+    page_ids = hit_ids[offset : offset + per_page]
+
+    posts = Post.objects.select_related("author__userprofile").in_bulk(page_ids)
+    object_list = [posts[post_id] for post_id in page_ids if post_id in posts]
+
+    next_cursor = previous_cursor = None
+    if offset + per_page < len(hit_ids):
+        next_cursor = _encode_offset(offset + per_page)
+    if offset > 0:
+        previous_cursor = _encode_offset(max(offset - per_page, 0))
+    return CursorPage(object_list, next_cursor, previous_cursor)
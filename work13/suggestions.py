@@ -0,0 +1,154 @@
+"""フォローグラフからの「知り合いかも」おすすめの一括計算
+
+候補のスコアは次の2つの合計。
+
+- 共通のフォロー: 自分がフォローしている人がフォローしている人（友達の友達）
+- 共通のいいね: 最近自分と同じ投稿にいいねした人
+
+リクエスト中に計算するとフォローの2段たどりになるため、
+build_follow_suggestions コマンドでまとめて計算し、上位 K 件を
+FollowSuggestion に保存する。表示側は1つのテーブルを読むだけでよい。
+
+ユーザー・投稿は 0..n-1 の連番に振り直し、隣接リストは array による
+CSR 形式（offsets と targets の2本の配列）で持つ。
+Python オブジェクトのリストに比べてメモリが小さく、全件を一度に載せられる。
+"""
+
+import heapq
+from array import array
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Follow, FollowSuggestion, Like
+
+TOP_K = 10
+MUTUAL_WEIGHT = 1.0
+CO_LIKE_WEIGHT = 0.5
+# フォロー数がこれより多い人を経由した候補は数えない（友達の友達の爆発を防ぐ）
+MAX_FANOUT = 1000
+# いいねがこれより多い投稿は共通のいいねに数えない（人気投稿は手がかりにならない）
+MAX_LIKERS_PER_POST = 200
+# 共通のいいねとして見る期間（日）
+LIKE_WINDOW_DAYS = 90
+# 何人分ずつ書き込むか
+WRITE_BATCH_SIZE = 500
+
+
+def _csr(size, rows, cols):
+    """(行, 列) の配列から CSR 形式の (offsets, targets) を作る"""
+    offsets = array("l", [0]) * (size + 1)
+    for row in rows:
+        offsets[row + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    targets = array("l", [0]) * len(rows)
+    fill = offsets[:-1]
+    for row, col in zip(rows, cols):
+        targets[fill[row]] = col
+        fill[row] += 1
+    return offsets, targets
+
+
+class _Graph:
+    """連番に振り直したフォロー・いいねの隣接リスト"""
+
+    def __init__(self, user_ids, like_since):
+        self.user_ids = array("q", user_ids)
+        user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+        size = len(user_ids)
+
+        rows, cols = array("l"), array("l")
+        for follower_id, following_id in Follow.objects.values_list(
+            "follower_id", "following_id"
+        ).iterator(chunk_size=10000):
+            follower, following = user_index.get(follower_id), user_index.get(following_id)
+            if follower is not None and following is not None:
+                rows.append(follower)
+                cols.append(following)
+        self.following = _csr(size, rows, cols)
+
+        post_index = {}
+        rows, cols = array("l"), array("l")
+        for user_id, post_id in (
+            Like.objects.filter(created_at__gte=like_since)
+            .values_list("user_id", "post_id")
+            .iterator(chunk_size=10000)
+        ):
+            user = user_index.get(user_id)
+            if user is not None:
+                rows.append(user)
+                cols.append(post_index.setdefault(post_id, len(post_index)))
+        self.liked_posts = _csr(size, rows, cols)
+        self.likers = _csr(len(post_index), cols, rows)
+
+    @staticmethod
+    def _neighbors(csr, i):
+        offsets, targets = csr
+        return targets[offsets[i] : offsets[i + 1]]
+
+    def score(self, user, top_k):
+        """1人分の候補を (スコア, 候補, 共通のフォロー数, 共通のいいね数) で上位 top_k 件返す"""
+        following = set(self._neighbors(self.following, user))
+
+        mutual = Counter()
+        for friend in following:
+            friends_of_friend = self._neighbors(self.following, friend)
+            if len(friends_of_friend) <= MAX_FANOUT:
+                mutual.update(friends_of_friend)
+
+        co_like = Counter()
+        for post in self._neighbors(self.liked_posts, user):
+            likers = self._neighbors(self.likers, post)
+            if len(likers) <= MAX_LIKERS_PER_POST:
+                co_like.update(likers)
+
+        candidates = (mutual.keys() | co_like.keys()) - following
+        candidates.discard(user)
+        return heapq.nlargest(
+            top_k,
+            (
+                (
+                    MUTUAL_WEIGHT * mutual[c] + CO_LIKE_WEIGHT * co_like[c],
+                    c,
+                    mutual[c],
+                    co_like[c],
+                )
+                for c in candidates
+            ),
+        )
+
+
+def build_follow_suggestions(top_k=TOP_K):
+    """全アクティブユーザーのおすすめを計算し直し、(ユーザー数, 保存件数) を返す"""
+    user_ids = list(
+        User.objects.filter(is_active=True).order_by("id").values_list("id", flat=True)
+    )
+    graph = _Graph(user_ids, timezone.now() - timedelta(days=LIKE_WINDOW_DAYS))
+
+    saved = 0
+    for start in range(0, len(user_ids), WRITE_BATCH_SIZE):
+        batch = range(start, min(start + WRITE_BATCH_SIZE, len(user_ids)))
+        suggestions = [
+            FollowSuggestion(
+                user_id=graph.user_ids[user],
+                suggested_id=graph.user_ids[candidate],
+                score=score,
+                mutual_count=mutual_count,
+                co_like_count=co_like_count,
+            )
+            for user in batch
+            for score, candidate, mutual_count, co_like_count in graph.score(user, top_k)
+        ]
+        # 候補がなくなったユーザーの古いおすすめも消す
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(
+                user_id__in=[graph.user_ids[user] for user in batch]
+            ).delete()
+            FollowSuggestion.objects.bulk_create(suggestions)
+        saved += len(suggestions)
+    return len(user_ids), saved
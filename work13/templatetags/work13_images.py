@@ -0,0 +1,42 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from work13.renditions import rendition_url, rendition_widths, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(instance, field_name, sizes, alt="", **attrs):
+    """レンディションから srcset/sizes 付きの <picture> を出力
+
+    使い方: {% responsive_image post "image" "(max-width: 600px) 100vw, 600px" alt="投稿画像" class="post-image" %}
+    レンディション生成前（処理待ち）の場合は元画像をそのまま表示する。
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return ""
+
+    spec = instance.IMAGE_SPECS[field_name]
+    key = getattr(instance, spec.rendition_field)
+    extra = format_html_join(
+        "", ' {}="{}"', ((name.replace("_", "-"), value) for name, value in attrs.items())
+    )
+    if not key:
+        return format_html('<img src="{}" alt="{}"{}>', field_file.url, alt, extra)
+
+    # 元画像より大きい幅は生成していないので載せない
+    widths = rendition_widths(spec.widths, getattr(instance, spec.width_field))
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async"{}>'
+        "</picture>",
+        srcset(key, widths, "webp"),
+        sizes,
+        rendition_url(key, widths[-1]),
+        srcset(key, widths),
+        sizes,
+        alt,
+        extra,
+    )
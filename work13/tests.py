@@ -1,3 +1,397 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from .conditional import post_detail_etag
+from .feed_cache import _post_version_key, wait_for_home_bumps
+from .models import Comment, Follow, Like, Notification, Post, SearchTerm, UserProfile
+from .notifications import notify, notify_bulk
+from .pagination import CursorPaginator, encode_cursor
+from .renditions import CACHE_CONTROL, build_renditions, closest_width, rendition_name
+from .templatetags.work13_images import responsive_image
+from .search import search_page, search_post_ids
+
+# 10件のホームタイムライン1ページに必要なクエリ数
+# （セッション・ログインユーザー・タイムライン・いいね状態・フォロー状態・未読バッジ）
+HOME_PAGE_QUERIES = 6
+
+
+class HomeFeedQueryCountTests(TestCase):
+    """ホームタイムラインのクエリ数が投稿者の人数に依存しないこと"""
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("viewer", password="password")
+        self.client.force_login(self.viewer)
+
+    def make_feed(self, author_count):
+        authors = []
+        for i in range(author_count):
+            author = User.objects.create_user(f"author{i}")
+            profile = author.userprofile
+            profile.avatar = "avatars/author.jpg"
+            # 半分はレンディション生成済みとして <picture> 側も通す
+            if i % 2:
+                profile.avatar_rendition = "0123456789abcdef0123456789abcdef.jpg"
+            profile.save()
+            Follow.objects.create(follower=self.viewer, following=author)
+            authors.append(author)
+
+        for i in range(10):
+            Post.objects.create(
+                author=authors[i % author_count],
+                image="posts/post.jpg",
+                caption=f"投稿{i}",
+            )
+
+    def assert_home_queries(self):
+        with self.assertNumQueries(HOME_PAGE_QUERIES):
+            response = self.client.get(reverse("work13:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.count(b"post-card"), 10)
+
+    def test_single_author(self):
+        self.make_feed(1)
+        self.assert_home_queries()
+
+    def test_ten_authors(self):
+        self.make_feed(10)
+        self.assert_home_queries()
+
+
+class HomeFeedCacheTests(TestCase):
+    """ホーム1ページ目のキャッシュと無効化"""
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("viewer", password="password")
+        self.author = User.objects.create_user("author")
+        self.client.force_login(self.viewer)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=self.viewer, following=self.author)
+            self.post = Post.objects.create(author=self.author, image="posts/post.jpg")
+        wait_for_home_bumps()
+
+    def get_home(self, queries):
+        with self.assertNumQueries(queries):
+            return self.client.get(reverse("work13:home"))
+
+    def test_repeat_visit_is_served_from_cache(self):
+        self.get_home(HOME_PAGE_QUERIES)
+        # 2回目はセッション・ログインユーザー・未読バッジの3件だけ
+        self.get_home(3)
+
+    def test_new_post_from_followed_author_invalidates(self):
+        self.get_home(HOME_PAGE_QUERIES)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, image="posts/new.jpg", caption="新着")
+        wait_for_home_bumps()
+        self.assertContains(self.get_home(HOME_PAGE_QUERIES), "新着")
+
+    def test_own_post_is_visible_right_after_posting(self):
+        self.client.force_login(self.author)
+        self.client.get(reverse("work13:home"))
+        # フォロワー分の更新が遅れていても、投稿者本人のキャッシュはすぐ無効になる
+        with mock.patch("work13.timeline.bump_home_versions_later"):
+            with self.captureOnCommitCallbacks(execute=True):
+                Post.objects.create(author=self.author, image="posts/new.jpg", caption="自分の新着")
+            self.assertContains(self.client.get(reverse("work13:home")), "自分の新着")
+
+    def test_follow_is_visible_right_after_following(self):
+        other = User.objects.create_user("other")
+        Post.objects.create(author=other, image="posts/other.jpg", caption="他の人の投稿")
+        self.client.get(reverse("work13:home"))
+        with mock.patch("work13.timeline.bump_home_versions_later"):
+            with self.captureOnCommitCallbacks(execute=True):
+                Follow.objects.create(follower=self.viewer, following=other)
+            self.assertContains(self.client.get(reverse("work13:home")), "他の人の投稿")
+
+    def test_like_invalidates_count_and_button_state(self):
+        self.get_home(HOME_PAGE_QUERIES)
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.viewer, post=self.post)
+        response = self.get_home(HOME_PAGE_QUERIES)
+        self.assertContains(response, '<strong class="like-count">1</strong>', html=True)
+        self.assertContains(response, 'data-liked="true"')
+
+    def test_evicted_post_version_invalidates(self):
+        self.get_home(HOME_PAGE_QUERIES)
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.viewer, post=self.post)
+        # いいね後のバージョンの鍵がキャッシュから追い出された場合
+        cache.delete(_post_version_key(self.post.id))
+        response = self.get_home(HOME_PAGE_QUERIES)
+        self.assertContains(response, '<strong class="like-count">1</strong>', html=True)
+
+
+class CursorPaginatorTests(TestCase):
+    """改ざんされたカーソルは先頭ページとして扱う"""
+
+    def setUp(self):
+        author = User.objects.create_user("author")
+        self.posts = [
+            Post.objects.create(author=author, image="posts/post.jpg") for _ in range(3)
+        ]
+
+    def first_page_ids(self, paginator):
+        return [post.id for post in paginator.get_page()]
+
+    def test_numeric_cursor_on_datetime_key(self):
+        paginator = CursorPaginator(Post.objects.all(), 2)
+        page = paginator.get_page(encode_cursor(1.5, 1, "n"))
+        self.assertEqual([post.id for post in page], self.first_page_ids(paginator))
+
+    def test_datetime_cursor_on_numeric_key(self):
+        paginator = CursorPaginator(Post.objects.all(), 2, fields=("trending_score", "id"))
+        page = paginator.get_page(encode_cursor(self.posts[0].created_at, 1, "n"))
+        self.assertEqual([post.id for post in page], self.first_page_ids(paginator))
+
+    def test_garbage_cursor(self):
+        paginator = CursorPaginator(Post.objects.all(), 2)
+        page = paginator.get_page("not-a-cursor")
+        self.assertEqual([post.id for post in page], self.first_page_ids(paginator))
+
+    def test_valid_cursor_pages_forward(self):
+        paginator = CursorPaginator(Post.objects.all(), 2)
+        page = paginator.get_page(paginator.get_page().next_cursor)
+        self.assertEqual([post.id for post in page], [self.posts[0].id])
+
+
+class NotificationCollapseTests(TestCase):
+    """未読の通知をまとめるときは別人の数だけを数える"""
+
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.a = User.objects.create_user("a")
+        self.b = User.objects.create_user("b")
+        self.post = Post.objects.create(author=self.author, image="posts/post.jpg")
+
+    def notification(self):
+        return Notification.objects.select_related("actor").get(
+            recipient=self.author, verb=Notification.LIKE
+        )
+
+    def test_returning_actor_is_not_counted_again(self):
+        for actor in (self.a, self.b, self.a):
+            notify(self.author.id, actor, Notification.LIKE, self.post.id)
+        notification = self.notification()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.message, "bさんと他1人があなたの投稿にいいねしました")
+
+    def test_distinct_actors_within_one_batch(self):
+        notify_bulk([
+            (self.author.id, actor, Notification.LIKE, self.post.id)
+            for actor in (self.a, self.b, self.a)
+        ])
+        notification = self.notification()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(UserProfile.objects.get(user=self.author).unread_notification_count, 1)
+        # 同じ人の次のいいねも数えない
+        notify(self.author.id, self.b, Notification.LIKE, self.post.id)
+        self.assertEqual(self.notification().actor_count, 2)
+
+
+class PostDeleteCounterTests(TestCase):
+    """投稿の削除で消えるいいね・コメントは、消える投稿のカウンターを更新しない"""
+
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.fans = [User.objects.create_user(f"fan{i}") for i in range(3)]
+        self.post = Post.objects.create(author=self.author, image="posts/post.jpg")
+        for fan in self.fans:
+            Like.objects.create(user=fan, post=self.post)
+            Comment.objects.create(user=fan, post=self.post, content="いいね")
+
+    def post_updates(self, queries):
+        return [q["sql"] for q in queries if q["sql"].startswith('UPDATE "work13_post"')]
+
+    def test_post_delete_skips_counter_updates(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+        self.assertEqual(self.post_updates(queries.captured_queries), [])
+        self.assertFalse(Like.objects.exists())
+
+    def test_queryset_delete_skips_counter_updates(self):
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.filter(author=self.author).delete()
+        self.assertEqual(self.post_updates(queries.captured_queries), [])
+
+    def test_post_delete_is_bulk_regardless_of_likes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+        few = len(queries.captured_queries)
+
+        popular = Post.objects.create(author=self.author, image="posts/popular.jpg")
+        fans = [User.objects.create_user(f"many{i}") for i in range(30)]
+        Like.objects.bulk_create([Like(user=fan, post=popular) for fan in fans])
+        Comment.objects.bulk_create(
+            [Comment(user=fan, post=popular, content="いいね") for fan in fans]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            popular.delete()
+        self.assertEqual(len(queries.captured_queries), few)
+        # いいね・コメントは読み込まずに一括 DELETE される
+        sqls = [q["sql"] for q in queries.captured_queries]
+        self.assertFalse([sql for sql in sqls if sql.startswith('SELECT "work13_like"')])
+        self.assertFalse([sql for sql in sqls if sql.startswith('SELECT "work13_comment"')])
+
+    def test_single_delete_decrements(self):
+        Like.objects.get(user=self.fans[0], post=self.post).delete()
+        Comment.objects.filter(user=self.fans[1], post=self.post).get().delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (2, 2))
+
+    def test_user_delete_still_decrements_other_posts(self):
+        self.fans[0].delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (2, 2))
+
+
+class PostDetailEtagTests(TestCase):
+    """投稿詳細の ETag はコメントの入れ替え・編集で変わる"""
+
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.post = Post.objects.create(author=self.author, image="posts/post.jpg")
+        self.comment = Comment.objects.create(user=self.author, post=self.post, content="最初")
+        self.request = RequestFactory().get(reverse("work13:post_detail", args=[self.post.pk]))
+        self.request.user = self.author
+
+    def etag(self):
+        return post_detail_etag(self.request, self.post.pk)
+
+    def test_etag_is_stable(self):
+        self.assertEqual(self.etag(), self.etag())
+
+    def test_viewer_without_profile(self):
+        UserProfile.objects.filter(user=self.author).delete()
+        self.request.user = User.objects.get(pk=self.author.pk)
+        self.assertIsNotNone(self.etag())
+
+    def test_etag_changes_when_comment_is_replaced(self):
+        before = self.etag()
+        self.comment.delete()
+        Comment.objects.create(user=self.author, post=self.post, content="差し替え")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertNotEqual(self.etag(), before)
+
+    def test_etag_changes_when_comment_is_edited(self):
+        before = self.etag()
+        Comment.objects.filter(pk=self.comment.pk).update(
+            content="編集", updated_at=self.comment.updated_at + timedelta(seconds=1)
+        )
+        self.assertNotEqual(self.etag(), before)
+
+
+class SearchTests(TestCase):
+    """検索の順位・ページ送りと、インデックスの作り直し"""
+
+    def setUp(self):
+        self.cat = User.objects.create_user("cat_lover")
+        self.other = User.objects.create_user("other")
+        self.by_name = Post.objects.create(author=self.cat, image="posts/post.jpg", caption="散歩")
+        self.by_caption = [
+            Post.objects.create(author=self.other, image="posts/post.jpg", caption=f"cat {i}")
+            for i in range(3)
+        ]
+
+    def test_username_match_ranks_first(self):
+        ids = search_post_ids("cat")
+        self.assertEqual(ids[0], self.by_name.id)
+        self.assertEqual(sorted(ids[1:]), sorted(post.id for post in self.by_caption))
+
+    def test_limit_and_paging(self):
+        self.assertEqual(len(search_post_ids("cat", limit=2)), 2)
+        first = search_page("cat", 3)
+        self.assertTrue(first.has_next())
+        second = search_page("cat", 3, first.next_cursor)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(second.has_next())
+
+    def test_save_without_caption_change_keeps_index(self):
+        post = Post.objects.get(pk=self.by_caption[0].pk)
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertFalse(
+            [q for q in queries.captured_queries if "work13_searchterm" in q["sql"]]
+        )
+
+    def test_caption_change_reindexes(self):
+        post = Post.objects.get(pk=self.by_caption[0].pk)
+        post.caption = "dog"
+        post.save()
+        self.assertNotIn(post.id, search_post_ids("cat"))
+        self.assertEqual(search_post_ids("dog"), [post.id])
+        self.assertTrue(SearchTerm.objects.filter(post=post, term="do").exists())
+
+
+class RenditionTests(TestCase):
+    """元画像より大きい幅は作らず、srcset にも載せない。配信は immutable"""
+
+    WIDTHS = (320, 480, 640, 800)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix="work13-media-")
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.source = os.path.join(self.media_root, "source.jpg")
+        Image.new("RGB", (500, 250), "white").save(self.source, format="JPEG")
+
+    def generated_widths(self, key):
+        return [
+            width
+            for width in (*self.WIDTHS, 500)
+            if os.path.exists(os.path.join(self.media_root, rendition_name(key, width)))
+        ]
+
+    def test_widths_larger_than_source_are_not_generated(self):
+        key, max_width = build_renditions(self.source, self.WIDTHS, self.media_root)
+        self.assertEqual(max_width, 500)
+        self.assertEqual(self.generated_widths(key), [320, 480, 500])
+        with Image.open(os.path.join(self.media_root, rendition_name(key, 500, "webp"))) as img:
+            self.assertEqual(img.width, 500)
+
+    def test_srcset_lists_only_generated_widths(self):
+        key, max_width = build_renditions(self.source, self.WIDTHS, self.media_root)
+        post = Post(image="posts/source.jpg", image_rendition=key, image_rendition_width=max_width)
+        html = responsive_image(post, "image", "100vw")
+        self.assertIn(" 500w", html)
+        self.assertNotIn(" 640w", html)
+        self.assertNotIn(" 800w", html)
+
+        # 最大幅の記録がない以前の画像は、これまでどおりすべての幅を載せる
+        post.image_rendition_width = None
+        self.assertIn(" 800w", responsive_image(post, "image", "100vw"))
+
+    def test_closest_width(self):
+        self.assertEqual(closest_width(self.WIDTHS, 500, 320), 320)
+        self.assertEqual(closest_width(self.WIDTHS, 200, 320), 200)
+        self.assertEqual(closest_width(self.WIDTHS, None, 700), 800)
+
+    def test_rendition_is_served_immutable(self):
+        key, max_width = build_renditions(self.source, self.WIDTHS, self.media_root)
+        name = rendition_name(key, max_width, "webp").partition("/")[2]
+        response = self.client.get(reverse("work13:rendition", args=[name]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertEqual(response["Cache-Control"], CACHE_CONTROL)
+        response.close()
+
+        missing = name.replace(f"-{max_width}.", "-640.")
+        self.assertEqual(
+            self.client.get(reverse("work13:rendition", args=[missing])).status_code, 404
+        )
@@ -0,0 +1,104 @@
+"""ホームタイムラインの書き込み時配信（fan-out on write）
+
+投稿が保存された時点で、投稿者本人とフォロワー全員の TimelineEntry を作成しておく。
+ホーム画面は (user, created_at) のインデックスを順に読むだけで済み、
+フォロー数が増えても Follow のサブクエリや OR 条件のスキャンは発生しない。
+タイムラインを書き換えたユーザーのホームのキャッシュは確定後に無効化する。
+操作したユーザー本人（投稿者・フォローした人）は直後にホームへ戻るのでその場で、
+それ以外のフォロワーは別スレッドで行う。
+"""
+
+from functools import partial
+
+from django.db import transaction
+
+from .feed_cache import bump_home_versions, bump_home_versions_later
+from .models import Follow, Post, TimelineEntry
+
+# 一度の bulk_create で作成する件数
+FAN_OUT_BATCH_SIZE = 1000
+
+# フォロー開始時にさかのぼって取り込む投稿数の上限
+BACKFILL_LIMIT = 200
+
+
+def _entries_for_post(post, user_ids):
+    return [
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            created_at=post.created_at,
+        )
+        for user_id in user_ids
+    ]
+
+
+def _bump_home_versions(user_ids, acting_user_id):
+    # 操作したユーザーは別スレッドの遅れで自分の変更が見えないことがないよう、その場で更新する
+    others = [user_id for user_id in user_ids if user_id != acting_user_id]
+    if len(others) < len(user_ids):
+        bump_home_versions([acting_user_id])
+    if others:
+        bump_home_versions_later(others)
+
+
+def _invalidate_home(user_ids, acting_user_id):
+    transaction.on_commit(partial(_bump_home_versions, list(user_ids), acting_user_id))
+
+
+def fan_out_post(post):
+    """新しい投稿を投稿者本人とフォロワーのタイムラインに配信"""
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list(
+        "follower_id", flat=True
+    )
+
+    batch = [post.author_id]
+    for follower_id in follower_ids.iterator(chunk_size=FAN_OUT_BATCH_SIZE):
+        batch.append(follower_id)
+        if len(batch) >= FAN_OUT_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(
+                _entries_for_post(post, batch), ignore_conflicts=True
+            )
+            _invalidate_home(batch, post.author_id)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(
+            _entries_for_post(post, batch), ignore_conflicts=True
+        )
+        _invalidate_home(batch, post.author_id)
+
+
+def backfill_follow(follower_id, following_id, limit=BACKFILL_LIMIT):
+    """フォロー開始時に相手の最近の投稿をタイムラインへ取り込む"""
+    posts = Post.objects.filter(author_id=following_id).order_by("-created_at")[:limit]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=follower_id,
+                post_id=post.id,
+                author_id=following_id,
+                created_at=post.created_at,
+            )
+            for post in posts.only("id", "created_at")
+        ],
+        ignore_conflicts=True,
+    )
+    _invalidate_home([follower_id], follower_id)
+
+
+def prune_follow(follower_id, following_id):
+    """フォロー解除時に相手の投稿をタイムラインから取り除く"""
+    TimelineEntry.objects.filter(user_id=follower_id, author_id=following_id).delete()
+    _invalidate_home([follower_id], follower_id)
+
+
+def rebuild_timeline(user_id, limit=BACKFILL_LIMIT):
+    """1ユーザー分のタイムラインを作り直す（既存データの移行・修復用）"""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    backfill_follow(user_id, user_id, limit=limit)
+    following_ids = Follow.objects.filter(follower_id=user_id).values_list(
+        "following_id", flat=True
+    )
+    for following_id in following_ids:
+        backfill_follow(user_id, following_id, limit=limit)
@@ -0,0 +1,84 @@
+"""explore の「トレンド」タブ用スコアの事前計算
+
+スコアは直近のいいね・コメントを時間減衰させて合計したもの。
+
+    score = Σ いいね × 0.5^(経過時間 / 半減期) + COMMENT_WEIGHT × Σ コメント × 0.5^(…)
+
+リクエストのたびに集計すると Like/Comment の全件走査になるため、
+update_trending_scores コマンドで定期的にまとめて計算し、
+インデックス付きの Post.trending_score 列に保存する。
+explore はその列を降順に読むだけでよい。
+
+計算は投稿×1時間単位の件数を SQL で集約してから Python で減衰を掛けるので、
+読み込む行数は「いいね数」ではなく「投稿数×窓の時間数」で頭打ちになる。
+"""
+
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Comment, Like, Post
+
+# 半減期（時間）
+HALF_LIFE_HOURS = 12
+# 集計対象の期間（時間）。これより古い反応の寄与は 1/64 未満なので無視する
+WINDOW_HOURS = 72
+# コメント1件をいいね何件分とみなすか
+COMMENT_WEIGHT = 2.0
+# これ未満のスコアは 0 として保存する
+MIN_SCORE = 0.01
+
+UPDATE_BATCH_SIZE = 500
+
+
+def _hourly_counts(model, since):
+    """(投稿ID, 時間の区切り, 件数) を1回のクエリで集計する"""
+    return (
+        model.objects.filter(created_at__gte=since)
+        .annotate(bucket=TruncHour("created_at", tzinfo=dt_timezone.utc))
+        .values_list("post_id", "bucket")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+
+
+def compute_scores(now=None, half_life_hours=HALF_LIFE_HOURS, window_hours=WINDOW_HOURS):
+    """投稿IDごとのトレンドスコアを計算する"""
+    now = now or timezone.now()
+    since = now - timedelta(hours=window_hours)
+    scores = {}
+    for model, weight in ((Like, 1.0), (Comment, COMMENT_WEIGHT)):
+        for post_id, bucket, total in _hourly_counts(model, since):
+            # 区切りの中央の時刻で経過時間を近似する
+            age = (now - bucket).total_seconds() / 3600 - 0.5
+            decay = 0.5 ** (max(age, 0) / half_life_hours)
+            scores[post_id] = scores.get(post_id, 0.0) + weight * total * decay
+    return {
+        post_id: round(score, 4) for post_id, score in scores.items() if score >= MIN_SCORE
+    }
+
+
+def update_trending_scores(now=None, **kwargs):
+    """trending_score 列を更新し、(更新件数, 0 に戻した件数) を返す"""
+    scores = compute_scores(now, **kwargs)
+    current = dict(
+        Post.objects.filter(trending_score__gt=0).values_list("id", "trending_score")
+    )
+
+    # 窓から外れた投稿は 0 に戻す
+    stale = sorted(set(current) - set(scores))
+    for i in range(0, len(stale), UPDATE_BATCH_SIZE):
+        Post.objects.filter(id__in=stale[i : i + UPDATE_BATCH_SIZE]).update(
+            trending_score=0
+        )
+
+    # 値が変わった投稿だけをまとめて書き込む
+    changed = [
+        Post(id=post_id, trending_score=score)
+        for post_id, score in scores.items()
+        if current.get(post_id) != score
+    ]
+    Post.objects.bulk_update(changed, ["trending_score"], batch_size=UPDATE_BATCH_SIZE)
+    return len(changed), len(stale)
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'work13'
@@ -14,13 +14,26 @@ urlpatterns = [
     path('post/<int:post_id>/delete/', views.delete_post, name='delete_post'),
     path('post/<int:post_id>/like/', views.toggle_like, name='toggle_like'),
     path('post/<int:post_id>/comment/', views.add_comment, name='add_comment'),
+    path('post/<int:post_id>/comments/', views.post_comments, name='post_comments'),
     
     # ユーザー関連
     path('user/<str:username>/', views.user_profile, name='user_profile'),
+    path('user/<str:username>/posts/', views.user_posts, name='user_posts'),
     path('user/<str:username>/follow/', views.toggle_follow, name='toggle_follow'),
     path('user/<str:username>/following/', views.following_list, name='following_list'),
     path('user/<str:username>/followers/', views.followers_list, name='followers_list'),
     
     # プロフィール編集
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+
+    # 通知
+    path('notifications/', views.notifications, name='notifications'),
+    path('notifications/read/', views.mark_notifications_read, name='mark_notifications_read'),
+
+    # レンディション（renditions/<ハッシュ先頭2文字>/<ハッシュ>-<幅>.<拡張子>）
+    re_path(
+        r'^renditions/(?P<name>[0-9a-f]{2}/[0-9a-f]{32}-[0-9]+\.(?:jpg|png|webp))$',
+        views.rendition,
+        name='rendition',
+    ),
 ]
@@ -0,0 +1,46 @@
+"""閲覧ユーザーごとの状態をページ単位でまとめて付与する
+
+投稿ごとに ``post.is_liked_by(user)`` を呼ぶと 1 件ごとに EXISTS クエリが走る。
+ここではページ内の投稿をまとめて、状態ごとに 1 回の集合クエリで解決し、
+結果を各オブジェクトの属性として載せる（テンプレートや JSON からそのまま参照できる）。
+
+付与される属性:
+    user_has_liked   閲覧ユーザーがいいね済みか
+    author_followed  閲覧ユーザーが投稿者をフォロー中か
+    is_own           閲覧ユーザー自身の投稿か
+"""
+
+from .models import Follow, Like
+
+
+def annotate_viewer_state(posts, viewer):
+    """投稿のリスト（またはページ）に閲覧ユーザーの状態を付与して返す"""
+    posts = list(posts)
+    if not viewer.is_authenticated or not posts:
+        for post in posts:
+            post.user_has_liked = False
+            post.author_followed = False
+            post.is_own = False
+        return posts
+
+    post_ids = [post.id for post in posts]
+    author_ids = {post.author_id for post in posts} - {viewer.id}
+
+    liked_ids = set(
+        Like.objects.filter(user=viewer, post_id__in=post_ids).values_list(
+            "post_id", flat=True
+        )
+    )
+    followed_ids = set()
+    if author_ids:
+        followed_ids = set(
+            Follow.objects.filter(
+                follower=viewer, following_id__in=author_ids
+            ).values_list("following_id", flat=True)
+        )
+
+    for post in posts:
+        post.user_has_liked = post.id in liked_ids
+        post.author_followed = post.author_id in followed_ids
+        post.is_own = post.author_id == viewer.id
+    return posts
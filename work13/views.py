@@ -1,50 +1,82 @@
+from functools import partial
+
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator
-from django.db.models import Q
-from .models import Post, Like, Follow, UserProfile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, JsonResponse
+from django.utils.http import http_date
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.db import transaction
+from django.db.models import F
+from .models import POST_IMAGE_SPEC, Post, Like, Comment, Follow, Notification, UserProfile, FollowSuggestion
+from .conditional import post_detail_etag, user_profile_etag
+from .feed_cache import cached_home_feed
 from .forms import PostCreateForm, CommentCreateForm, UserProfileForm
+from .notifications import mark_all_read, notify
+from .pagination import CursorPaginator
+from .realtime import publish_comment, publish_like, publish_new_post
+from .renditions import CACHE_CONTROL, CONTENT_TYPES, RENDITION_DIR, closest_width, rendition_url
+from .search import search_page
+from .viewer_state import annotate_viewer_state
 
 
-def home(request):
-    """ホームタイムライン"""
+def _home_posts(request, cursor):
     if request.user.is_authenticated:
-        # フォローしているユーザーの投稿を取得
-        following_users = Follow.objects.filter(follower=request.user).values_list(
-            "following", flat=True
-        )
+        # 書き込み時に配信済みのタイムラインを (user, created_at) 順に読む
         posts = (
-            Post.objects.filter(Q(author__in=following_users) | Q(author=request.user))
-            .select_related("author")
-            .prefetch_related("likes", "comments")
+            Post.objects.filter(timeline_entries__user=request.user)
+            .annotate(
+                feed_created_at=F("timeline_entries__created_at"),
+                feed_post_id=F("timeline_entries__post_id"),
+            )
+            .select_related("author__userprofile")
+        )
+        paginator = CursorPaginator(
+            posts, 10, fields=("feed_created_at", "feed_post_id")
         )
     else:
         # 未ログインユーザーには全ての投稿を表示
         posts = (
             Post.objects.all()
-            .select_related("author")
-            .prefetch_related("likes", "comments")
+            .select_related("author__userprofile")
         )
+        paginator = CursorPaginator(posts, 10)
 
-    # ページネーション
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    posts = paginator.get_page(page_number)
+    # カーソルページネーション（COUNT・OFFSETなし）
+    posts = paginator.get_page(cursor)
 
-    # 各投稿にいいね状態を追加
-    if request.user.is_authenticated:
-        for post in posts:
-            post.user_has_liked = post.is_liked_by(request.user)
+    # いいね・フォロー状態をページ単位でまとめて付与
+    annotate_viewer_state(posts, request.user)
+    return posts
+
+
+def _render_home_feed(request, posts):
+    return render_to_string("work13/_home_feed.html", {"posts": posts}, request)
+
+
+def home(request):
+    """ホームタイムライン"""
+    if request.user.is_authenticated and not request.GET:
+        # 1ページ目は描画済みの投稿一覧をユーザーごとにキャッシュ
+        feed_html = cached_home_feed(
+            request,
+            partial(_home_posts, request, None),
+            partial(_render_home_feed, request),
+        )
+    else:
+        posts = _home_posts(request, request.GET.get("cursor"))
+        feed_html = _render_home_feed(request, posts)
 
     # 投稿フォーム
     form = PostCreateForm() if request.user.is_authenticated else None
 
     context = {
-        "posts": posts,
+        "feed_html": mark_safe(feed_html),
         "form": form,
     }
     return render(request, "work13/home.html", context)
@@ -58,7 +90,11 @@ def create_post(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            with transaction.atomic():
+                # 投稿数カウンターはシグナルで同じトランザクション内に更新される
+                post.save()
+                # フォロワーのライブフィードへ新着を通知
+                transaction.on_commit(partial(publish_new_post, post))
             messages.success(request, "投稿が作成されました！")
             return redirect("work13:home")
     else:
@@ -70,10 +106,38 @@ def create_post(request):
     return render(request, "work13/create_post.html", context)
 
 
+# 詳細ページに直接表示するコメント数（それより前は JSON で追加読み込み）
+INLINE_COMMENT_COUNT = 20
+COMMENT_PAGE_SIZE = 20
+
+
+def _comment_page(post, per_page, cursor=None):
+    """新しい順のコメントを1ページ分取得（next_cursor でさらに古いものへ）"""
+    comments = Comment.objects.filter(post=post).select_related(
+        "user__userprofile"
+    )
+    return CursorPaginator(comments, per_page).get_page(cursor)
+
+
+def _serialize_comment(comment):
+    return {
+        "id": comment.id,
+        "content": comment.content,
+        "user": comment.user.username,
+        "created_at": comment.created_at.strftime("%Y/%m/%d %H:%M"),
+    }
+
+
+@condition(etag_func=post_detail_etag)
 def post_detail(request, post_id):
-    """投稿詳細表示"""
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all().select_related("user")
+    """投稿詳細表示（ETag が一致すれば 304）"""
+    post = get_object_or_404(
+        Post.objects.select_related("author__userprofile"), id=post_id
+    )
+
+    # 最新のコメントだけを表示し、古いものは comments_json で読み込む
+    page = _comment_page(post, INLINE_COMMENT_COUNT)
+    comments = list(reversed(page.object_list))
 
     # コメントフォーム
     comment_form = CommentCreateForm() if request.user.is_authenticated else None
@@ -81,9 +145,28 @@ def post_detail(request, post_id):
     context = {
         "post": post,
         "comments": comments,
+        "older_comments_cursor": page.next_cursor,
         "comment_form": comment_form,
     }
-    return render(request, "work13/post_detail.html", context)
+    response = render(request, "work13/post_detail.html", context)
+    # いいね・コメントでは updated_at が変わらないため、304 の判定は ETag だけで行い
+    # Last-Modified は参考として付ける（If-None-Match があれば If-Modified-Since は使われない）
+    response["Last-Modified"] = http_date(post.updated_at.timestamp())
+    return response
+
+
+def post_comments(request, post_id):
+    """古いコメントの追加読み込み（カーソル形式の JSON）"""
+    post = get_object_or_404(Post.objects.only("id"), id=post_id)
+    page = _comment_page(post, COMMENT_PAGE_SIZE, request.GET.get("cursor"))
+
+    return JsonResponse(
+        {
+            # 表示順（古い順）で返す
+            "comments": [_serialize_comment(c) for c in reversed(page.object_list)],
+            "next_cursor": page.next_cursor,
+        }
+    )
 
 
 @login_required
@@ -91,19 +174,26 @@ def post_detail(request, post_id):
 def toggle_like(request, post_id):
     """いいねの切り替え（Ajax対応）"""
     post = get_object_or_404(Post, id=post_id)
-    like, created = Like.objects.get_or_create(user=request.user, post=post)
+    with transaction.atomic():
+        # いいね数は作成時はシグナル、削除時は Like.delete で F() 更新される
+        like, created = Like.objects.get_or_create(user=request.user, post=post)
+
+        if not created:
+            # 既にいいねしている場合は削除
+            like.delete()
+            liked = False
+        else:
+            liked = True
+            notify(post.author_id, request.user, Notification.LIKE, post.id)
 
-    if not created:
-        # 既にいいねしている場合は削除
-        like.delete()
-        liked = False
-    else:
-        liked = True
+        # 購読中のブラウザへサーバーから送信（いいね数は短い時間窓でまとめる）
+        transaction.on_commit(partial(publish_like, post.id))
 
+    post.refresh_from_db(fields=["like_count"])
     return JsonResponse(
         {
             "liked": liked,
-            "like_count": post.like_count(),
+            "like_count": post.like_count,
         }
     )
 
@@ -119,19 +209,18 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.user = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            # コメント数はシグナルで F() 更新される
+            comment.save()
+            notify(post.author_id, request.user, Notification.COMMENT, post.id)
+            transaction.on_commit(partial(publish_comment, comment))
 
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
             # Ajax リクエストの場合
             return JsonResponse(
                 {
                     "success": True,
-                    "comment": {
-                        "id": comment.id,
-                        "content": comment.content,
-                        "user": comment.user.username,
-                        "created_at": comment.created_at.strftime("%Y/%m/%d %H:%M"),
-                    },
+                    "comment": _serialize_comment(comment),
                 }
             )
         else:
@@ -142,10 +231,36 @@ def add_comment(request, post_id):
     return redirect("work13:post_detail", post_id=post_id)
 
 
+# プロフィールのグリッドは ID とサムネイルだけを読む
+PROFILE_GRID_FIELDS = (
+    "id", "author_id", "created_at", "image", "image_rendition", "image_rendition_width"
+)
+PROFILE_GRID_PAGE_SIZE = 12
+PROFILE_GRID_THUMBNAIL_WIDTH = 320
+
+
+def _profile_grid_page(user, cursor):
+    posts = Post.objects.filter(author=user).only(*PROFILE_GRID_FIELDS)
+    return CursorPaginator(posts, PROFILE_GRID_PAGE_SIZE).get_page(cursor)
+
+
+def _grid_thumbnail(post, ext=None):
+    if post.image_rendition:
+        width = closest_width(
+            POST_IMAGE_SPEC.widths, post.image_rendition_width, PROFILE_GRID_THUMBNAIL_WIDTH
+        )
+        return rendition_url(post.image_rendition, width, ext)
+    return post.image.url
+
+
+@condition(
+    etag_func=partial(user_profile_etag, grid_size=PROFILE_GRID_PAGE_SIZE)
+)
 def user_profile(request, username):
-    """ユーザープロフィール表示"""
+    """ユーザープロフィール表示（ETag が一致すれば 304）"""
     user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user).order_by("-created_at")
+    posts = _profile_grid_page(user, request.GET.get("cursor"))
+    annotate_viewer_state(posts, request.user)
 
     # フォロー状態をチェック
     is_following = False
@@ -154,10 +269,20 @@ def user_profile(request, username):
             follower=request.user, following=user
         ).exists()
 
-    # 統計情報
-    post_count = posts.count()
-    follower_count = user.followers.count()
-    following_count = user.following.count()
+    # 統計情報（UserProfile の非正規化カウンター）
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+    post_count = profile.post_count
+    follower_count = profile.follower_count
+    following_count = profile.following_count
+
+    # サイドバーのおすすめユーザー（一括計算済みの FollowSuggestion を読むだけ）
+    suggestions = []
+    if request.user.is_authenticated:
+        suggestions = (
+            FollowSuggestion.objects.filter(user=request.user)
+            .exclude(suggested=user)
+            .select_related("suggested__userprofile")[:5]
+        )
 
     context = {
         "profile_user": user,
@@ -166,10 +291,34 @@ def user_profile(request, username):
         "post_count": post_count,
         "follower_count": follower_count,
         "following_count": following_count,
+        "suggestions": suggestions,
     }
     return render(request, "work13/user_profile.html", context)
 
 
+def user_posts(request, username):
+    """プロフィールのグリッド用投稿一覧（無限スクロール用 JSON）"""
+    user = get_object_or_404(User, username=username)
+    posts = _profile_grid_page(user, request.GET.get("cursor"))
+
+    return JsonResponse(
+        {
+            "posts": [
+                {
+                    "id": post.id,
+                    "url": reverse("work13:post_detail", args=[post.id]),
+                    "thumbnail": _grid_thumbnail(post),
+                    "thumbnail_webp": (
+                        _grid_thumbnail(post, "webp") if post.image_rendition else None
+                    ),
+                }
+                for post in posts
+            ],
+            "next_cursor": posts.next_cursor,
+        }
+    )
+
+
 @login_required
 def edit_profile(request):
     """プロフィール編集"""
@@ -200,13 +349,19 @@ def toggle_follow(request, username):
         messages.error(request, "自分をフォローすることはできません。")
         return redirect("work13:user_profile", username=username)
 
-    follow, created = Follow.objects.get_or_create(
-        follower=request.user, following=user_to_follow
-    )
+    with transaction.atomic():
+        # フォロー数カウンター・タイムラインはシグナルで同じトランザクション内に更新される
+        follow, created = Follow.objects.get_or_create(
+            follower=request.user, following=user_to_follow
+        )
+
+        if not created:
+            # 既にフォローしている場合は削除
+            follow.delete()
+        else:
+            notify(user_to_follow.id, request.user, Notification.FOLLOW)
 
     if not created:
-        # 既にフォローしている場合は削除
-        follow.delete()
         messages.success(
             request, f"{user_to_follow.username}のフォローを解除しました。"
         )
@@ -226,35 +381,41 @@ def delete_post(request, post_id):
         messages.error(request, "この投稿を削除する権限がありません。")
         return redirect("work13:post_detail", post_id=post_id)
 
-    post.delete()
+    with transaction.atomic():
+        post.delete()
     messages.success(request, "投稿を削除しました。")
     return redirect("work13:home")
 
 
 def explore(request):
     """投稿を探索"""
-    posts = (
-        Post.objects.all()
-        .select_related("author")
-        .prefetch_related("likes", "comments")
-    )
-
-    # 検索機能
     search_query = request.GET.get("search")
-    if search_query:
-        posts = posts.filter(
-            Q(caption__icontains=search_query)
-            | Q(author__username__icontains=search_query)
-        )
+    tab = request.GET.get("tab")
+    cursor = request.GET.get("cursor")
 
-    # ページネーション
-    paginator = Paginator(posts, 12)
-    page_number = request.GET.get("page")
-    posts = paginator.get_page(page_number)
+    if search_query:
+        # 検索機能（bigram 転置インデックスでスコア順に取得）
+        posts = search_page(search_query, 12, cursor)
+    elif tab == "trending":
+        # 事前計算済みのトレンドスコア順（インデックスを降順に読むだけ）
+        posts = CursorPaginator(
+            Post.objects.select_related("author__userprofile").filter(
+                trending_score__gt=0
+            ),
+            12,
+            fields=("trending_score", "id"),
+        ).get_page(cursor)
+    else:
+        # カーソルページネーション（COUNT・OFFSETなし）
+        posts = CursorPaginator(
+            Post.objects.select_related("author__userprofile"), 12
+        ).get_page(cursor)
+    annotate_viewer_state(posts, request.user)
 
     context = {
         "posts": posts,
         "search_query": search_query,
+        "tab": tab,
     }
     return render(request, "work13/explore.html", context)
 
@@ -283,3 +444,55 @@ def followers_list(request, username):
         "followers": followers,
     }
     return render(request, "work13/followers_list.html", context)
+
+
+# 通知一覧で返す件数
+NOTIFICATION_LIST_SIZE = 30
+
+
+@login_required
+def notifications(request):
+    """通知一覧（JSON）"""
+    items = (
+        Notification.objects.filter(recipient=request.user)
+        .select_related("actor")[:NOTIFICATION_LIST_SIZE]
+    )
+    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+
+    return JsonResponse(
+        {
+            "unread_count": profile.unread_notification_count,
+            "notifications": [
+                {
+                    "id": n.id,
+                    "type": n.verb,
+                    "message": n.message,
+                    "from_user": n.actor.username,
+                    "post_id": n.post_id,
+                    "is_read": n.is_read,
+                    "updated_at": n.updated_at.strftime("%Y/%m/%d %H:%M"),
+                }
+                for n in items
+            ],
+        }
+    )
+
+
+@login_required
+@require_POST
+def mark_notifications_read(request):
+    """通知をすべて既読にする"""
+    mark_all_read(request.user)
+    return JsonResponse({"unread_count": 0})
+
+
+@require_GET
+def rendition(request, name):
+    """レンディションを配信する（名前が内容ごとに変わるので永続的にキャッシュさせる）"""
+    try:
+        f = default_storage.open(f"{RENDITION_DIR}/{name}")
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(f, content_type=CONTENT_TYPES[name.rpartition(".")[2]])
+    response["Cache-Control"] = CACHE_CONTROL
+    return response